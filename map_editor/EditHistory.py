@@ -0,0 +1,240 @@
+import zlib
+from collections import deque
+from typing import *
+
+import numpy as np
+
+from TileLayer import *
+
+# Default memory budget of the history in bytes, the oldest edits being forgotten first once it is exceeded
+HISTORY_LIMIT = 64 << 20
+
+
+def compress_layer(layer: TileLayer):
+    """
+    Returns layer as (w, h, zlib-compressed tile IDs)
+
+    :rtype: (int, int, bytes)
+    """
+    return layer.w, layer.h, zlib.compress(np.ascontiguousarray(layer.to_array(), dtype=np.uint8).tobytes())
+
+
+def decompress_layer(compressed: Tuple[int, int, bytes]):
+    """
+    Returns the layer compressed by compress_layer
+
+    :rtype: ChunkedTileLayer
+    """
+    w, h, data = compressed
+    return ChunkedTileLayer.from_array(np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape((h, w)))
+
+
+def grow_layers(layers: List[TileLayer], floor: int):
+    """
+    Adds empty floors on top of layers until floor exists
+    """
+    while len(layers) <= floor:
+        layers.append(ChunkedTileLayer(layers[0].w, layers[0].h))
+
+
+class StrokeEdit:
+    """
+    This class defines the cells painted on a floor from a mouse press to its release.
+    S.floor is the index of the floor painted on.
+    S.tile is the tile ID painted (EMPTY_TILE for an erasing stroke).
+    S.xs, S.ys are the coordinates of every cell that changed.
+    S.olds are the tile IDs of those cells before the stroke.
+    S.nbytes is the memory used by S.
+    """
+
+    def __init__(self, floor: int, tile: int, cells: Dict[Tuple[int, int], int]):
+        self.floor = floor
+        self.tile = tile
+        coordinates = np.array(list(cells), dtype=np.uint32).reshape((-1, 2))
+        self.xs = coordinates[:, 0].copy()
+        self.ys = coordinates[:, 1].copy()
+        self.olds = np.array(list(cells.values()), dtype=np.uint8)
+        self.nbytes = self.xs.nbytes + self.ys.nbytes + self.olds.nbytes
+
+    def undo(self, layers: List[TileLayer]):
+        """
+        Gives the cells of the stroke their previous tiles back
+
+        :return: layers and the changes made, as (floor, cells, tile) groups
+        ///////////////
+        :rtype: (List[TileLayer], List[(int, List[(int, int)], int)])
+        """
+        grow_layers(layers, self.floor)
+        changes = []
+        for tile in np.unique(self.olds).tolist():
+            mask = self.olds == tile
+            cells = list(zip(self.xs[mask].tolist(), self.ys[mask].tolist()))
+            changes.append((self.floor, layers[self.floor].set_cells(cells, tile), tile))
+        return layers, changes
+
+    def redo(self, layers: List[TileLayer]):
+        grow_layers(layers, self.floor)
+        cells = list(zip(self.xs.tolist(), self.ys.tolist()))
+        return layers, [(self.floor, layers[self.floor].set_cells(cells, self.tile), self.tile)]
+
+
+class ClearEdit:
+    """
+    This class defines the clearing of a single floor (CLEAR L{n}).
+    C.floor is the index of the cleared floor.
+    C.compressed is the floor before it was cleared, compressed (see compress_layer).
+    C.nbytes is the memory used by C.
+    """
+
+    def __init__(self, floor: int, layer: TileLayer):
+        self.floor = floor
+        self.compressed = compress_layer(layer)
+        self.nbytes = len(self.compressed[2])
+
+    def undo(self, layers: List[TileLayer]):
+        grow_layers(layers, self.floor)
+        layers[self.floor] = decompress_layer(self.compressed)
+        return layers, None
+
+    def redo(self, layers: List[TileLayer]):
+        grow_layers(layers, self.floor)
+        layers[self.floor].clear()
+        return layers, None
+
+
+class ClearAllEdit:
+    """
+    This class defines the clearing of the whole map (CLEAR ALL).
+    C.compressed is the list of the floors before they were cleared, compressed (see compress_layer).
+    C.w, C.h is the size of the single empty floor left by the clearing.
+    C.nbytes is the memory used by C.
+    """
+
+    def __init__(self, layers: List[TileLayer], w: int, h: int):
+        self.compressed = [compress_layer(layer) for layer in layers]
+        self.w = w
+        self.h = h
+        self.nbytes = sum(len(c[2]) for c in self.compressed)
+
+    def undo(self, layers: List[TileLayer]):
+        return [decompress_layer(c) for c in self.compressed], None
+
+    def redo(self, layers: List[TileLayer]):
+        return [ChunkedTileLayer(self.w, self.h)], None
+
+
+class EditHistory:
+    """
+    This class defines the undo and redo history of the editor, holding only what each edit changed.
+    Undoing or redoing an edit costs the size of that edit, whatever the size of the map.
+    H.undos is the queue of edits that can be undone, the last one being the most recent.
+    H.redos is the stack of undone edits that can be redone, the last one being the most recently undone.
+    H.limit is the memory budget in bytes of H.
+    H.nbytes is the memory currently used by H.
+    H.stroke is the (floor, tile, old tile of each cell) of the stroke being painted, None between strokes.
+    """
+
+    def __init__(self, limit: int = HISTORY_LIMIT):
+        self.undos: Deque = deque()
+        self.redos: List = []
+        self.limit = limit
+        self.nbytes = 0
+        self.stroke: Optional[Tuple[int, int, Dict[Tuple[int, int], int]]] = None
+
+    def __str__(self):
+        return "EditHistory ({0} undos, {1} redos, {2}/{3} bytes)".format(len(self.undos), len(self.redos),
+                                                                         self.nbytes, self.limit)
+
+    def push(self, edit):
+        """
+        Adds a new edit, forgetting the undone ones and the oldest ones if the budget is exceeded
+        """
+        self.nbytes -= sum(e.nbytes for e in self.redos)
+        self.redos = []
+        self.undos.append(edit)
+        self.nbytes += edit.nbytes
+        while self.nbytes > self.limit and len(self.undos) > 1:
+            self.nbytes -= self.undos.popleft().nbytes
+
+    def record_cells(self, floor: int, cells: List[Tuple[int, int]], olds: List[int], tile: int):
+        """
+        Adds painted cells to the current stroke (started if needed), cells painted twice keeping their first old tile
+
+        :param floor: index of the floor painted on
+        :param cells: coordinates of the cells that changed
+        :param olds: tile ID of each cell before it was painted
+        :param tile: tile ID painted
+        ///////////////
+        :type floor: int
+        :type cells: List[(int, int)]
+        :type olds: List[int]
+        :type tile: int
+        """
+        if self.stroke is not None and self.stroke[:2] != (floor, tile):
+            self.end_stroke()
+        if self.stroke is None:
+            self.stroke = (floor, tile, {})
+        strokeCells = self.stroke[2]
+        for cell, old in zip(cells, olds):
+            strokeCells.setdefault(cell, old)
+
+    def end_stroke(self):
+        """
+        Turns the current stroke into a single edit
+        """
+        if self.stroke is not None:
+            floor, tile, cells = self.stroke
+            self.stroke = None
+            if cells:
+                self.push(StrokeEdit(floor, tile, cells))
+
+    def record_clear(self, floor: int, layer: TileLayer):
+        """
+        Records that floor is about to be cleared (must be called before clearing it)
+        """
+        self.end_stroke()
+        self.push(ClearEdit(floor, layer))
+
+    def record_clear_all(self, layers: List[TileLayer], w: int, h: int):
+        """
+        Records that the whole map is about to be replaced by a single empty w*h floor (must be called before)
+        """
+        self.end_stroke()
+        self.push(ClearAllEdit(layers, w, h))
+
+    def undo(self, layers: List[TileLayer]):
+        """
+        Undoes the most recent edit
+
+        :param layers: floors of the map
+        ///////////////
+        :type layers: List[TileLayer]
+        ///////////////
+        :return: floors of the map and the changes made as (floor, cells, tile) groups (None if whole floors
+                 changed, [] if there was nothing to undo)
+        ///////////////
+        :rtype: (List[TileLayer], List[(int, List[(int, int)], int)])
+        """
+        self.end_stroke()
+        if not self.undos:
+            return layers, []
+        edit = self.undos.pop()
+        self.redos.append(edit)
+        return edit.undo(layers)
+
+    def redo(self, layers: List[TileLayer]):
+        """
+        Redoes the most recently undone edit (see undo)
+        """
+        self.end_stroke()
+        if not self.redos:
+            return layers, []
+        edit = self.redos.pop()
+        self.undos.append(edit)
+        return edit.redo(layers)
+
+    def clear(self):
+        self.undos.clear()
+        self.redos = []
+        self.nbytes = 0
+        self.stroke = None
@@ -0,0 +1,179 @@
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import *
+
+import numpy as np
+import pygame
+
+from TileLayer import *
+
+# File names of the image of floor i (formatted with i) and of the floors squashed together
+LAYER_FILE = "layer_{0}.png"
+SQUASHED_FILE = "layers.png"
+
+# Below this amount of cells to export, images are encoded in the calling thread (not worth dispatching)
+EXPORT_PARALLEL_CELLS = 1 << 20
+
+# Worker threads encoding the images, started on the first large export and kept for the next ones
+# Threads rather than processes: a spawned worker process would re-import the editor, whose ezgraphics opens a window
+# when imported. The images are written by encode_floor rather than pygame.image.save, which holds the GIL.
+EXPORT_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def export_pool():
+    """
+    Returns the pool of worker threads encoding images, starting it if needed
+
+    :rtype: ThreadPoolExecutor
+    """
+    global EXPORT_POOL
+    if EXPORT_POOL is None:
+        EXPORT_POOL = ThreadPoolExecutor()
+    return EXPORT_POOL
+
+
+# Layout of the PNG files written by encode_floor (big-endian): signature, then chunks made of the size of their data,
+# their type, their data and the CRC-32 of their type and data. Images are 8-bit RGB, every row being stored as its
+# difference with the row above (which makes the large areas of a single tile compress well).
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_CHUNK = struct.Struct(">I4s")
+PNG_CHECKSUM = struct.Struct(">I")
+PNG_IHDR = struct.Struct(">IIBBBBB")  # w, h, bit depth, color type (2: RGB), compression, filter, interlace
+PNG_RGB = 2
+PNG_FILTER_UP = 2
+PNG_COMPRESSION = 6
+
+
+def png_chunk(kind: bytes, data: bytes):
+    """
+    Returns a PNG chunk of type kind holding data
+
+    :rtype: bytes
+    """
+    return PNG_CHUNK.pack(len(data), kind) + data + PNG_CHECKSUM.pack(zlib.crc32(data, zlib.crc32(kind)))
+
+
+def squash(floors: List[np.ndarray]):
+    """
+    Returns the tile IDs seen from above a stack of floors, upper floors hiding the lower ones where they are painted
+
+    :param floors: (h, w) arrays of tile IDs, from the lowest floor to the highest
+    ///////////////
+    :type floors: List[np.ndarray]
+    ///////////////
+    :rtype: np.ndarray
+    """
+    tiles = np.zeros(floors[0].shape, dtype=np.uint8)
+    for floor in floors:
+        tiles = np.where(floor != EMPTY_TILE, floor, tiles)
+    return tiles
+
+
+def encode_floor(tiles: np.ndarray, colors: np.ndarray, path: str):
+    """
+    Saves the image of tiles to path as a PNG file, with one pixel per cell
+    The pixels are built with a single palette lookup and compressed by zlib, which releases the GIL, so that images
+    are encoded at the same time on the worker threads (only uses numpy, so that it can run in a worker process too)
+
+    :param tiles: (h, w) array of tile IDs
+    :param colors: (256, 3) array of the RGB color of every tile ID (see TileRegistry.palette)
+    :param path: output image path
+    ///////////////
+    :type tiles: np.ndarray
+    :type colors: np.ndarray
+    :type path: str
+    ///////////////
+    :return: path
+    ///////////////
+    :rtype: str
+    """
+    h, w = tiles.shape
+    pixels = colors[tiles].reshape(h, 3 * w)
+
+    # Every row starts with its filter type, the row above the first one being all zeros
+    rows = np.empty((h, 1 + 3 * w), dtype=np.uint8)
+    rows[:, 0] = PNG_FILTER_UP
+    rows[0, 1:] = pixels[0]
+    np.subtract(pixels[1:], pixels[:-1], out=rows[1:, 1:])
+    del pixels
+    data = zlib.compress(rows, PNG_COMPRESSION)
+    del rows
+
+    with open(path, "wb") as file:
+        file.write(PNG_SIGNATURE)
+        file.write(png_chunk(b"IHDR", PNG_IHDR.pack(w, h, 8, PNG_RGB, 0, 0, 0)))
+        file.write(png_chunk(b"IDAT", data))
+        file.write(png_chunk(b"IEND", b""))
+    return path
+
+
+def export_floors(layers: List[TileLayer], registry, directory: str, name: str = LAYER_FILE,
+                  composite: str = None, top: int = -1, parallel: bool = None):
+    """
+    Saves the image of every floor to directory, and optionally the image of the floors squashed together
+    Each image is rendered and encoded on its own, on a pool of worker threads for large maps
+
+    :param layers: floors of the map
+    :param registry: tiles the IDs of layers refer to
+    :param directory: output directory
+    :param name: file name of the image of floor i, formatted with i
+    :param composite: file name of the squashed image (not saved if None)
+    :param top: highest floor included in the squashed image (default is the highest floor of the map)
+    :param parallel: images are encoded in worker threads if True (default is only for large maps)
+    ///////////////
+    :type layers: List[TileLayer]
+    :type registry: TileRegistry
+    :type directory: str
+    :type name: str
+    :type composite: str
+    :type top: int
+    :type parallel: bool
+    ///////////////
+    :return: paths of the saved images
+    ///////////////
+    :rtype: List[str]
+    """
+    colors = registry.palette()
+    floors = [layer.to_array() for layer in layers]
+    jobs = [(tiles, os.path.join(directory, name.format(i))) for i, tiles in enumerate(floors)]
+    if composite is not None:
+        jobs.append((squash(floors[:len(floors) if top == -1 else top + 1]), os.path.join(directory, composite)))
+
+    if parallel is None:
+        parallel = len(jobs) > 1 and sum(tiles.size for tiles, path in jobs) >= EXPORT_PARALLEL_CELLS
+    if not parallel:
+        return [encode_floor(tiles, colors, path) for tiles, path in jobs]
+    pool = export_pool()
+    return list(pool.map(encode_floor, [tiles for tiles, path in jobs], [colors] * len(jobs),
+                         [path for tiles, path in jobs]))
+
+
+def load_floors(directory: str, registry, name: str = LAYER_FILE):
+    """
+    Loads the images of the floors of a map saved by export_floors, stopping at the first missing one
+    Raises ValueError if a floor isn't of the same size as floor 0, since a map only has one size
+
+    :param directory: directory the images are in
+    :param registry: tiles the colors of the images are looked up in
+    :param name: file name of the image of floor i, formatted with i
+    ///////////////
+    :type directory: str
+    :type registry: TileRegistry
+    :type name: str
+    ///////////////
+    :return: loaded floors, empty if there is none
+    ///////////////
+    :rtype: List[ChunkedTileLayer]
+    """
+    layers: List[ChunkedTileLayer] = []
+    path = os.path.join(directory, name.format(len(layers)))
+    while os.path.isfile(path):
+        layer = ChunkedTileLayer.from_array(registry.from_surface(pygame.image.load(path)))
+        if layers and (layer.w, layer.h) != (layers[0].w, layers[0].h):
+            raise ValueError("{0} is {1}x{2} but floor 0 is {3}x{4}".format(path, layer.w, layer.h, layers[0].w,
+                                                                           layers[0].h))
+        layers.append(layer)
+        path = os.path.join(directory, name.format(len(layers)))
+    return layers
@@ -0,0 +1,377 @@
+import mmap
+import os
+import struct
+import zlib
+from typing import *
+
+import numpy as np
+
+from TileLayer import *
+
+# Layout of a .gwm (Golden Wind Map) file, every integer being little-endian:
+#   header     magic, version, size of the whole header, w, h, floor count, palette size, compression
+#   palette    for each tile ID from 1 on, its name (u8 length + UTF-8 bytes, empty for unused IDs)
+#   floors     for each floor, offset in the file, compressed size and CRC-32 of its compressed data
+#   checksum   CRC-32 of everything above
+#   data       for each floor, its (h, w) uint8 array of tile IDs, compressed with zlib or stored as is
+# Uncompressed floors can be memory-mapped and edited in place (see MappedMap), their CRC-32 is then left at 0
+GWM_MAGIC = b"GWM\x00"
+GWM_VERSION = 2
+GWM_HEADER = struct.Struct("<4sHIIIHHH")
+GWM_FLOOR = struct.Struct("<QII")
+GWM_CHECKSUM = struct.Struct("<I")
+
+# Compression of the floors
+GWM_RAW = 0
+GWM_ZLIB = 1
+
+
+class MapHeader:
+    """
+    This class defines the header of a .gwm file.
+    M.w is the width of every floor in tiles.
+    M.h is the height of every floor in tiles.
+    M.names is the list of tile names indexed by tile ID (M.names[EMPTY_TILE] is "").
+    M.floors is the list of (offset, size, crc) of the stored data of each floor.
+    M.compression is the compression of the floors (GWM_ZLIB or GWM_RAW).
+    """
+
+    def __init__(self, w: int, h: int, names: List[str], floors: List[Tuple[int, int, int]],
+                 compression: int = GWM_ZLIB):
+        self.w = w
+        self.h = h
+        self.names = names
+        self.floors = floors
+        self.compression = compression
+
+    def __str__(self):
+        return "MapHeader {0}x{1} ({2} floors, {3} tiles)".format(self.w, self.h, len(self.floors),
+                                                                 len(self.names) - 1)
+
+    def size(self):
+        """
+        Returns the size in bytes of the header, i.e. the offset of the data of the first floor
+
+        :rtype: int
+        """
+        return (GWM_HEADER.size + sum(1 + len(name.encode("utf-8")) for name in self.names[1:]) +
+                len(self.floors) * GWM_FLOOR.size + GWM_CHECKSUM.size)
+
+    def pack(self):
+        """
+        Returns the bytes of the header, checksum included
+
+        :rtype: bytes
+        """
+        data = bytearray(GWM_HEADER.pack(GWM_MAGIC, GWM_VERSION, self.size(), self.w, self.h, len(self.floors),
+                                         len(self.names) - 1, self.compression))
+        for name in self.names[1:]:
+            encoded = name.encode("utf-8")
+            data += struct.pack("<B", len(encoded)) + encoded
+        for floor in self.floors:
+            data += GWM_FLOOR.pack(*floor)
+        data += GWM_CHECKSUM.pack(zlib.crc32(data))
+        return bytes(data)
+
+    @staticmethod
+    def read(file: BinaryIO):
+        """
+        Reads the header at the current position of file (i.e. its start), leaving file right after it
+
+        :param file: .gwm file opened in binary mode
+        ///////////////
+        :type file: BinaryIO
+        ///////////////
+        :rtype: MapHeader
+        """
+        data = file.read(GWM_HEADER.size)
+        if len(data) == GWM_HEADER.size:
+            data += file.read(max(0, GWM_HEADER.unpack(data)[2] - len(data)))
+        return MapHeader.unpack(data)
+
+    @staticmethod
+    def unpack(data: bytes):
+        """
+        Reads the header at the start of data
+
+        :param data: content of a .gwm file, or at least its header
+        ///////////////
+        :type data: bytes
+        ///////////////
+        :rtype: MapHeader
+        """
+        if len(data) < GWM_HEADER.size:
+            raise ValueError("not a .gwm file (too short)")
+        magic, version, size, w, h, floorCount, paletteSize, compression = GWM_HEADER.unpack_from(data)
+        if magic != GWM_MAGIC:
+            raise ValueError("not a .gwm file (bad magic number)")
+        if version != GWM_VERSION:
+            raise ValueError("unsupported .gwm version {0}".format(version))
+        if compression not in (GWM_RAW, GWM_ZLIB):
+            raise ValueError("corrupted .gwm header (unknown compression {0})".format(compression))
+
+        if size < GWM_HEADER.size + GWM_CHECKSUM.size:
+            raise ValueError("corrupted .gwm header (bad header size)")
+        # Tile IDs are bytes, the palette names the IDs from 1 on
+        if paletteSize > 255:
+            raise ValueError("corrupted .gwm header (more than 255 tiles)")
+        if len(data) < size:
+            raise ValueError("corrupted .gwm header (truncated)")
+
+        # Every part of the header has to fit in its size before being read, the size itself being checked last
+        offset = GWM_HEADER.size
+        names = [""]
+        for i in range(paletteSize):
+            if offset >= size or offset + 1 + data[offset] > size:
+                raise ValueError("corrupted .gwm header (palette past the end of the header)")
+            length = data[offset]
+            names.append(bytes(data[offset + 1:offset + 1 + length]).decode("utf-8"))
+            offset += 1 + length
+
+        if offset + floorCount * GWM_FLOOR.size + GWM_CHECKSUM.size != size:
+            raise ValueError("corrupted .gwm header (bad header size)")
+        floors = [GWM_FLOOR.unpack_from(data, offset + i * GWM_FLOOR.size) for i in range(floorCount)]
+        offset += floorCount * GWM_FLOOR.size
+
+        checksum, = GWM_CHECKSUM.unpack_from(data, offset)
+        if zlib.crc32(data[:offset]) != checksum or offset + GWM_CHECKSUM.size != size:
+            raise ValueError("corrupted .gwm header (checksum mismatch)")
+        return MapHeader(w, h, names, floors, compression)
+
+
+def palette_names(registry):
+    """
+    Returns the list of tile names indexed by tile ID ("" for EMPTY_TILE and unused IDs)
+
+    :param registry: tiles available in the editor
+    ///////////////
+    :type registry: TileRegistry
+    ///////////////
+    :rtype: List[str]
+    """
+    names = [""] * len(registry.types)
+    for t in registry:
+        names[t.id] = t.name
+    return names
+
+
+def palette_remap(names: List[str], registry):
+    """
+    Returns the (256,) array turning the tile IDs of a file into the tile IDs of registry, matching tiles by name
+    Tiles that no longer exist become EMPTY_TILE
+
+    :param names: tile names of the file, indexed by tile ID
+    :param registry: tiles available in the editor
+    ///////////////
+    :type names: List[str]
+    :type registry: TileRegistry
+    ///////////////
+    :rtype: np.ndarray
+    """
+    remap = np.zeros(256, dtype=np.uint8)
+    for tile, name in enumerate(names):
+        if name:
+            remap[tile] = registry.from_name(name)
+    return remap
+
+
+def save_gwm(path: str, layers: List[ChunkedTileLayer], registry, compressed: bool = True):
+    """
+    Saves every layer to a .gwm file, in a single write to a temporary file then replacing path with it, so that
+    path never holds a partly written map (it may be the base of the autosave journal)
+
+    :param path: output file path
+    :param layers: floors of the map, all of the same size
+    :param registry: tiles the IDs of layers refer to
+    :param compressed: floors are stored uncompressed (so that the file can be opened with MappedMap) if False
+    ///////////////
+    :type path: str
+    :type layers: List[ChunkedTileLayer]
+    :type registry: TileRegistry
+    :type compressed: bool
+    """
+    blobs = [np.ascontiguousarray(layer.to_array(), dtype=np.uint8).tobytes() for layer in layers]
+    if compressed:
+        blobs = [zlib.compress(blob) for blob in blobs]
+    header = MapHeader(layers[0].w, layers[0].h, palette_names(registry), [(0, 0, 0)] * len(blobs),
+                       GWM_ZLIB if compressed else GWM_RAW)
+
+    # Offsets only depend on the size of the header, which doesn't depend on them
+    offset = header.size()
+    for i, blob in enumerate(blobs):
+        header.floors[i] = (offset, len(blob), zlib.crc32(blob) if compressed else 0)
+        offset += len(blob)
+
+    with open(path + ".tmp", "wb") as file:
+        file.write(b"".join([header.pack()] + blobs))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def decode_floor(blob: bytes, header: MapHeader, index: int):
+    """
+    Returns the (h, w) array of tile IDs of floor index, as stored in the file
+
+    :param blob: compressed data of the floor
+    :param header: header of the file
+    :param index: floor index
+    ///////////////
+    :type blob: bytes
+    :type header: MapHeader
+    :type index: int
+    ///////////////
+    :rtype: np.ndarray
+    """
+    offset, size, crc = header.floors[index]
+    if len(blob) != size or (header.compression != GWM_RAW and zlib.crc32(blob) != crc):
+        raise ValueError("corrupted .gwm floor {0} (checksum mismatch)".format(index))
+    tiles = np.frombuffer(zlib.decompress(blob) if header.compression != GWM_RAW else blob, dtype=np.uint8)
+    if tiles.size != header.w * header.h:
+        raise ValueError("corrupted .gwm floor {0} (wrong size)".format(index))
+    return tiles.reshape((header.h, header.w))
+
+
+def load_gwm(path: str, registry):
+    """
+    Loads every floor of a .gwm file, in a single read
+    Tiles are matched by name, so the map survives changes to the order of buttons.blf
+
+    :param path: .gwm file path
+    :param registry: tiles available in the editor
+    ///////////////
+    :type path: str
+    :type registry: TileRegistry
+    ///////////////
+    :rtype: List[ChunkedTileLayer]
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    header = MapHeader.unpack(data)
+    remap = palette_remap(header.names, registry)
+    return [ChunkedTileLayer.from_array(remap[decode_floor(data[offset:offset + size], header, i)])
+            for i, (offset, size, crc) in enumerate(header.floors)]
+
+
+def load_gwm_floor(path: str, registry, index: int):
+    """
+    Loads a single floor of a .gwm file, reading only the header and that floor
+
+    :param path: .gwm file path
+    :param registry: tiles available in the editor
+    :param index: floor index
+    ///////////////
+    :type path: str
+    :type registry: TileRegistry
+    :type index: int
+    ///////////////
+    :rtype: ChunkedTileLayer
+    """
+    with open(path, "rb") as file:
+        header = MapHeader.read(file)
+        offset, size, crc = header.floors[index]
+        file.seek(offset)
+        blob = file.read(size)
+    return ChunkedTileLayer.from_array(palette_remap(header.names, registry)[decode_floor(blob, header, index)])
+
+
+class MappedMap:
+    """
+    This class defines a .gwm file with uncompressed floors opened through mmap.
+    Opening it takes the same time whatever the size of the map: only the header is read, and the pages of a floor
+    are only read from the file when its cells are accessed. Edits are written back to the file in place.
+    M.path is the path of the file.
+    M.header is the header of the file.
+    M.layers is the list of TileLayer of each floor, their tiles being views onto the file.
+    """
+
+    def __init__(self, path: str, registry, writable: bool = True):
+        self.path = path
+        self.file = open(path, "r+b" if writable else "rb")
+        try:
+            self.header = MapHeader.read(self.file)
+            if self.header.compression != GWM_RAW:
+                raise ValueError("{0} is compressed and can't be memory-mapped".format(path))
+
+            # Tile IDs are used as they are, so they have to mean the same thing in the file and in the editor
+            remap = palette_remap(self.header.names, registry)
+            if any(name and remap[tile] != tile for tile, name in enumerate(self.header.names)):
+                raise ValueError("the tiles of {0} don't match the tiles of the editor".format(path))
+
+            self.file.seek(0, 2)
+            for i, (offset, size, crc) in enumerate(self.header.floors):
+                if size != self.header.w * self.header.h:
+                    raise ValueError("corrupted .gwm floor {0} (wrong size)".format(i))
+                if offset + size > self.file.tell():
+                    raise ValueError("corrupted .gwm file (truncated)")
+
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        except Exception:
+            self.file.close()
+            raise
+
+        w, h = self.header.w, self.header.h
+        self.layers: List[TileLayer] = [TileLayer(w, h, np.ndarray((h, w), np.uint8, self.mmap, offset))
+                                        for offset, size, crc in self.header.floors]
+
+    def __str__(self):
+        return "MappedMap {0} ({1})".format(self.path, self.header)
+
+    def holds(self, layers: List[TileLayer]):
+        """
+        Returns True if layers are exactly the floors of the file (i.e. saving them only takes a flush)
+
+        :param layers: floors of the map
+        ///////////////
+        :type layers: List[TileLayer]
+        ///////////////
+        :rtype: bool
+        """
+        return len(layers) == len(self.layers) and all(a is b for a, b in zip(layers, self.layers))
+
+    def flush(self):
+        """
+        Writes the edited pages back to the file
+        """
+        self.mmap.flush()
+
+    def close(self, detach: bool = False):
+        """
+        Closes the file, writing the edits back to it
+
+        :param detach: the floors are first copied to memory so that M.layers can still be used if True
+        ///////////////
+        :type detach: bool
+        """
+        for layer in self.layers:
+            layer.tiles = np.array(layer.tiles) if detach else None
+        if not self.mmap.closed:
+            self.mmap.flush()
+            self.mmap.close()
+        self.file.close()
+
+
+def open_gwm(path: str, registry):
+    """
+    Opens a .gwm file, memory-mapping it if its floors are uncompressed and its tiles match registry,
+    loading it otherwise
+
+    :param path: .gwm file path
+    :param registry: tiles available in the editor
+    ///////////////
+    :type path: str
+    :type registry: TileRegistry
+    ///////////////
+    :return: floors of the map and the mapping they are views onto (None if the file was loaded)
+    ///////////////
+    :rtype: (List[TileLayer], MappedMap)
+    """
+    with open(path, "rb") as file:
+        header = MapHeader.read(file)
+    if header.compression == GWM_RAW:
+        try:
+            mapped = MappedMap(path, registry)
+            return list(mapped.layers), mapped
+        except ValueError:
+            pass
+    return load_gwm(path, registry), None
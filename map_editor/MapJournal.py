@@ -0,0 +1,268 @@
+import os
+import struct
+import zlib
+from typing import *
+
+import numpy as np
+
+from MapFile import *
+from TileLayer import *
+
+# Layout of a .gwj (Golden Wind Journal) file, every integer being little-endian:
+#   header     magic, version, size of the base path, base path (UTF-8)
+#   records    type, payload size, payload, CRC-32 of the type, size and payload
+# Records are only ever appended. Replaying them in order over the base (the .gwm file the journal starts from: a
+# snapshot saved alongside it, or the map file the map was loaded from or saved to) gives the map back; replay stops
+# at the first incomplete or corrupted record (i.e. the one being written during a crash).
+GWJ_MAGIC = b"GWJ\x00"
+GWJ_VERSION = 2
+GWJ_HEADER = struct.Struct("<4sHH")
+GWJ_RECORD = struct.Struct("<BI")
+GWJ_CHECKSUM = struct.Struct("<I")
+
+# Record types and their payload
+GWJ_SET = 1  # floor (u16), tile (u8), then the x-coordinates and y-coordinates of the cells (u32 each)
+GWJ_CLEAR_FLOOR = 2  # floor (u16)
+GWJ_CLEAR_ALL = 3  # w, h (u32 each), the map goes back to a single empty w*h floor
+GWJ_ADD_FLOOR = 4  # floor count (u16), empty floors are added on top of the map until it has that many
+
+GWJ_SET_HEADER = struct.Struct("<HB")
+GWJ_FLOOR = struct.Struct("<H")
+GWJ_SIZE = struct.Struct("<II")
+
+# Journal size above which the map is compacted into a new snapshot on the next autosave
+JOURNAL_SNAPSHOT_SIZE = 4 << 20
+
+
+class EditJournal:
+    """
+    This class defines the autosave of a map: a snapshot of the map and a journal of every edit made since.
+    Edits are kept in memory until flushed, so that an autosave only costs the size of the edits since the last one.
+    J.snapshotPath is the path of the snapshot (a .gwm file).
+    J.path is the path of the journal.
+    J.base is the path of the .gwm file the journal starts from (J.snapshotPath unless the journal was rebased).
+    J.registry is the tiles the map refers to.
+    J.pending is the records not written to the journal yet.
+    J.size is the size in bytes of the journal file.
+    """
+
+    def __init__(self, path: str, snapshotPath: str, registry):
+        self.path = path
+        self.snapshotPath = snapshotPath
+        self.base = snapshotPath
+        self.registry = registry
+        self.pending = bytearray()
+        self.size = os.path.getsize(path) if os.path.isfile(path) else 0
+
+    def __str__(self):
+        return "EditJournal {0} ({1} bytes, {2} pending)".format(self.path, self.size, len(self.pending))
+
+    def append(self, kind: int, payload: bytes = b""):
+        record = GWJ_RECORD.pack(kind, len(payload)) + payload
+        self.pending += record + GWJ_CHECKSUM.pack(zlib.crc32(record))
+
+    def record_cells(self, floor: int, cells: List[Tuple[int, int]], tile: int):
+        """
+        Records that tile was painted on cells of floor (EMPTY_TILE meaning they were erased)
+
+        :param floor: floor index
+        :param cells: (x, y) coordinates of the cells that changed
+        :param tile: tile ID
+        ///////////////
+        :type floor: int
+        :type cells: List[(int, int)]
+        :type tile: int
+        """
+        if cells:
+            coordinates = np.array(cells, dtype=np.uint32)
+            self.append(GWJ_SET, GWJ_SET_HEADER.pack(floor, tile) + coordinates.T.astype("<u4").tobytes())
+
+    def record_clear(self, floor: int):
+        self.append(GWJ_CLEAR_FLOOR, GWJ_FLOOR.pack(floor))
+
+    def record_clear_all(self, w: int, h: int):
+        self.append(GWJ_CLEAR_ALL, GWJ_SIZE.pack(w, h))
+
+    def record_add_floor(self, count: int):
+        self.append(GWJ_ADD_FLOOR, GWJ_FLOOR.pack(count))
+
+    def flush(self):
+        """
+        Appends the pending records to the journal file and makes sure they reached the disk
+        """
+        if not self.pending:
+            return
+        if self.size == 0:
+            raise ValueError("the journal has no snapshot to start from (see EditJournal.snapshot)")
+        with open(self.path, "ab") as file:
+            file.write(self.pending)
+            file.flush()
+            os.fsync(file.fileno())
+        self.size += len(self.pending)
+        self.pending = bytearray()
+
+    def start(self, base: str):
+        """
+        Replaces the journal by a new, empty one starting from the .gwm file base
+        """
+        header = GWJ_HEADER.pack(GWJ_MAGIC, GWJ_VERSION, len(base.encode())) + base.encode()
+        with open(self.path + ".tmp", "wb") as file:
+            file.write(header)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+        self.base = base
+        self.size = len(header)
+        self.pending = bytearray()
+
+    def snapshot(self, layers: List[TileLayer]):
+        """
+        Saves the whole map as the new snapshot and starts a new, empty journal from it
+
+        :param layers: floors of the map
+        ///////////////
+        :type layers: List[TileLayer]
+        """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Every record is idempotent, so replaying an old journal over a newer snapshot gives the snapshot back as
+        # long as the journal holds every edit the snapshot holds: once the pending ones are flushed, a crash between
+        # the two replacements loses nothing
+        if self.size:
+            self.flush()
+        save_gwm(self.snapshotPath, layers, self.registry)
+        self.start(self.snapshotPath)
+
+    def rebase(self, base: str):
+        """
+        Starts a new, empty journal from the .gwm file base, which must hold the map as it is now (e.g. the file it
+        was just loaded from or saved to), so that no snapshot has to be written
+
+        :param base: path of the .gwm file
+        ///////////////
+        :type base: str
+        """
+        # Same as for snapshot, the old journal has to hold every edit the base holds
+        if self.size:
+            self.flush()
+        self.start(base)
+        if os.path.isfile(self.snapshotPath):
+            os.remove(self.snapshotPath)
+
+    def autosave(self, layers: List[TileLayer]):
+        """
+        Flushes the pending edits, compacting the map into a new snapshot once the journal got too big
+
+        :param layers: floors of the map
+        ///////////////
+        :type layers: List[TileLayer]
+        """
+        if self.size == 0 or self.size + len(self.pending) > JOURNAL_SNAPSHOT_SIZE or not os.path.isfile(self.base):
+            self.snapshot(layers)
+        else:
+            self.flush()
+
+    def discard(self):
+        """
+        Removes the snapshot and the journal (e.g. when the editor is closed normally)
+        """
+        for path in (self.path, self.snapshotPath):
+            if os.path.isfile(path):
+                os.remove(path)
+        self.size = 0
+        self.pending = bytearray()
+
+
+def journal_base(data: bytes):
+    """
+    Returns the path of the .gwm file a journal starts from and the offset of its first record, None if data isn't a
+    journal
+
+    :param data: content of the journal file
+    ///////////////
+    :type data: bytes
+    ///////////////
+    :rtype: (str, int)
+    """
+    if len(data) < GWJ_HEADER.size:
+        return None
+    magic, version, size = GWJ_HEADER.unpack_from(data)
+    if (magic, version) != (GWJ_MAGIC, GWJ_VERSION) or GWJ_HEADER.size + size > len(data):
+        return None
+    return data[GWJ_HEADER.size:GWJ_HEADER.size + size].decode(errors="replace"), GWJ_HEADER.size + size
+
+
+def replay_journal(data: bytes, layers: List[ChunkedTileLayer], offset: int):
+    """
+    Applies the records of a journal to layers, stopping at the first incomplete or corrupted one
+
+    :param data: content of the journal file
+    :param layers: floors of the map, modified in place
+    :param offset: offset of the first record (see journal_base)
+    ///////////////
+    :type data: bytes
+    :type layers: List[ChunkedTileLayer]
+    :type offset: int
+    ///////////////
+    :return: floors of the map (a new list if the whole map was cleared) and the offset of the end of the last
+             record applied
+    ///////////////
+    :rtype: (List[ChunkedTileLayer], int)
+    """
+    while offset + GWJ_RECORD.size + GWJ_CHECKSUM.size <= len(data):
+        kind, size = GWJ_RECORD.unpack_from(data, offset)
+        end = offset + GWJ_RECORD.size + size
+        if end + GWJ_CHECKSUM.size > len(data) or \
+                zlib.crc32(data[offset:end]) != GWJ_CHECKSUM.unpack_from(data, end)[0]:
+            break
+        payload = data[offset + GWJ_RECORD.size:end]
+        offset = end + GWJ_CHECKSUM.size
+
+        if kind == GWJ_SET:
+            floor, tile = GWJ_SET_HEADER.unpack_from(payload)
+            coordinates = np.frombuffer(payload, dtype="<u4", offset=GWJ_SET_HEADER.size).reshape((2, -1))
+            layers[floor].set_cells(zip(coordinates[0].tolist(), coordinates[1].tolist()), tile)
+        elif kind == GWJ_CLEAR_FLOOR:
+            layers[GWJ_FLOOR.unpack(payload)[0]].clear()
+        elif kind == GWJ_CLEAR_ALL:
+            layers = [ChunkedTileLayer(*GWJ_SIZE.unpack(payload))]
+        elif kind == GWJ_ADD_FLOOR:
+            while len(layers) < GWJ_FLOOR.unpack(payload)[0]:
+                layers.append(ChunkedTileLayer(layers[0].w, layers[0].h))
+    return layers, offset
+
+
+def restore_journal(journal: EditJournal):
+    """
+    Rebuilds the map left by a crash from the base and records of the journal of journal
+    The journal then goes on from there: the incomplete or corrupted record it may end with is cut off, and the
+    following edits are appended to it
+
+    :param journal: autosave to restore
+    ///////////////
+    :type journal: EditJournal
+    ///////////////
+    :return: floors of the map, None if there is nothing to restore
+    ///////////////
+    :rtype: List[ChunkedTileLayer]
+    """
+    if not os.path.isfile(journal.path):
+        return None
+    with open(journal.path, "rb") as file:
+        data = file.read()
+    found = journal_base(data)
+    if found is None or not os.path.isfile(found[0]):
+        return None
+    base, offset = found
+
+    layers, end = replay_journal(data, load_gwm(base, journal.registry), offset)
+    if end < len(data):
+        with open(journal.path, "r+b") as file:
+            file.truncate(end)
+    journal.base = base
+    journal.size = end
+    journal.pending = bytearray()
+    return layers
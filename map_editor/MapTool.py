@@ -0,0 +1,213 @@
+"""
+Golden Wind Map Editor command-line tool, converting, exporting and validating whole directories of maps
+Runs without any display: neither the editor nor ezgraphics (which opens a window when imported) are imported
+
+A map is either a .gwm file or a directory holding the images layer_0.png, layer_1.png... of its floors
+
+e.g.  python MapTool.py convert maps/ -o out/ --format raw
+      python MapTool.py export maps/ -o out/ --squashed
+      python MapTool.py validate maps/
+"""
+import os
+
+# Never open a window, even if pygame ends up initializing its display
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import *
+
+import numpy as np
+import pygame
+
+from MapExport import *
+from MapFile import *
+from TileLayer import *
+from TileRegistry import *
+
+# Tiles of the editor, next to this file
+DEFAULT_BLF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "buttons.blf")
+
+# Tiles used by the worker processes, loaded once per process
+WORKER_REGISTRY: Optional[TileRegistry] = None
+
+
+def find_maps(directory: str):
+    """
+    Returns the paths of the maps found in directory (not recursively)
+
+    :param directory: directory to look in
+    ///////////////
+    :type directory: str
+    ///////////////
+    :rtype: List[str]
+    """
+    maps = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and name.lower().endswith(".gwm"):
+            maps.append(path)
+        elif os.path.isfile(os.path.join(path, LAYER_FILE.format(0))):
+            maps.append(path)
+    return maps
+
+
+def map_name(path: str):
+    """
+    Returns the name of the map at path (file or directory name without extension)
+
+    :rtype: str
+    """
+    return os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+
+
+def read_map(path: str, registry: TileRegistry):
+    """
+    Loads every floor of the map at path
+
+    :param path: .gwm file or directory of floor images
+    :param registry: tiles available in the editor
+    ///////////////
+    :type path: str
+    :type registry: TileRegistry
+    ///////////////
+    :rtype: List[ChunkedTileLayer]
+    """
+    layers = load_gwm(path, registry) if os.path.isfile(path) else load_floors(path, registry)
+    if not layers:
+        raise ValueError("no floor")
+    # A map only has one size, floors of other sizes would be saved as a .gwm file that can't be read back
+    sizes = sorted({(layer.w, layer.h) for layer in layers})
+    if len(sizes) > 1:
+        raise ValueError("floors of different sizes: {0}".format(", ".join("{0}x{1}".format(*s) for s in sizes)))
+    return layers
+
+
+def validate_map(path: str, registry: TileRegistry):
+    """
+    Checks that the map at path can be loaded without losing anything
+
+    :param path: .gwm file or directory of floor images
+    :param registry: tiles available in the editor
+    ///////////////
+    :type path: str
+    :type registry: TileRegistry
+    ///////////////
+    :return: problems found, empty if there is none
+    ///////////////
+    :rtype: List[str]
+    """
+    problems = []
+    if os.path.isfile(path):
+        with open(path, "rb") as file:
+            data = file.read()
+        header = MapHeader.unpack(data)
+        for i, (offset, size, crc) in enumerate(header.floors):
+            tiles = decode_floor(data[offset:offset + size], header, i)
+            counts = np.bincount(tiles.ravel(), minlength=256)
+            for tile in np.nonzero(counts)[0]:
+                name = header.names[tile] if tile < len(header.names) else ""
+                if tile != EMPTY_TILE and registry.from_name(name) == EMPTY_TILE:
+                    problems.append("floor {0}: {1} cells of unknown tile {2} ({3!r})".format(i, counts[tile], tile,
+                                                                                             name))
+    else:
+        sizes = set()
+        i = 0
+        while os.path.isfile(os.path.join(path, LAYER_FILE.format(i))):
+            S = pygame.image.load(os.path.join(path, LAYER_FILE.format(i)))
+            sizes.add(S.get_size())
+            # Colors that aren't tiles are lost on load, so they don't survive a load and save
+            original = pygame.surfarray.array3d(S)
+            restored = pygame.surfarray.array3d(registry.to_surface(registry.from_surface(S)))
+            unknown = int(np.count_nonzero((original != restored).any(axis=2)))
+            if unknown:
+                problems.append("floor {0}: {1} pixels of unknown colors".format(i, unknown))
+            i += 1
+        if i == 0:
+            problems.append("no floor")
+        if len(sizes) > 1:
+            problems.append("floors of different sizes: {0}".format(", ".join("{0}x{1}".format(*s) for s in sizes)))
+    return problems
+
+
+def init_worker(blfPath: str):
+    global WORKER_REGISTRY
+    WORKER_REGISTRY = load_registry(blfPath)
+
+
+def process_map(command: str, path: str, output: str, options: Dict[str, Any]):
+    """
+    Runs command on the map at path, in a worker process
+
+    :param command: "convert", "export" or "validate"
+    :param path: .gwm file or directory of floor images
+    :param output: output directory (unused when validating)
+    :param options: command-line options
+    ///////////////
+    :type command: str
+    :type path: str
+    :type output: str
+    :type options: Dict[str, Any]
+    ///////////////
+    :return: path and the problems found (empty if everything went fine)
+    ///////////////
+    :rtype: (str, List[str])
+    """
+    try:
+        if command == "validate":
+            return path, validate_map(path, WORKER_REGISTRY)
+
+        layers = read_map(path, WORKER_REGISTRY)
+        if command == "convert":
+            save_gwm(os.path.join(output, map_name(path) + ".gwm"), layers, WORKER_REGISTRY,
+                     options["format"] == "gwm")
+        else:
+            directory = os.path.join(output, map_name(path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            export_floors(layers, WORKER_REGISTRY, directory, composite=SQUASHED_FILE if options["squashed"] else None,
+                          parallel=False)
+        return path, []
+    except (OSError, ValueError, pygame.error) as e:
+        return path, [str(e)]
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Converts, exports and validates Golden Wind maps, without display")
+    parser.add_argument("command", choices=["convert", "export", "validate"],
+                        help="convert: save as .gwm, export: save as images, validate: check that maps load")
+    parser.add_argument("directory", help="directory of maps (.gwm files and directories of layer_N.png images)")
+    parser.add_argument("-o", "--output", default="out", help="output directory (default: out)")
+    parser.add_argument("--format", choices=["gwm", "raw"], default="gwm",
+                        help="convert: compressed .gwm or uncompressed .gwm that can be memory-mapped")
+    parser.add_argument("--squashed", action="store_true", help="export: also save every floor squashed together")
+    parser.add_argument("--blf", default=DEFAULT_BLF, help="tiles of the editor (default: buttons.blf)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes (default: cores)")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.directory):
+        parser.error("{0} is not a directory".format(args.directory))
+
+    maps = find_maps(args.directory)
+    if args.command != "validate" and not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    options = {"format": args.format, "squashed": args.squashed}
+
+    failed = 0
+    with ProcessPoolExecutor(args.jobs, initializer=init_worker, initargs=(args.blf,)) as pool:
+        for path, problems in pool.map(process_map, [args.command] * len(maps), maps, [args.output] * len(maps),
+                                       [options] * len(maps)):
+            if problems:
+                failed += 1
+                print("FAILED {0}".format(path))
+                for problem in problems:
+                    print("    " + problem)
+            else:
+                print("OK     {0}".format(path))
+
+    print("{0} map(s), {1} failed".format(len(maps), failed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
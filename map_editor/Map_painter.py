@@ -1,12 +1,51 @@
+from EditHistory import *
 from LearningAides import *
+from MapExport import *
+from MapFile import *
+from MapJournal import *
+from TileAtlas import *
+from TileLayer import *
+from TileRegistry import *
 import os
 
+# Frame rate cap while painting
+MAX_FPS = 60
+# Longest time the editor sleeps waiting for an event while idle (ms)
+IDLE_TIMEOUT = 500
+
+# Directory maps are saved to and loaded from
+IO_DIRECTORY = "IO"
+# Native map file, holding every floor
+MAP_FILE = "map.gwm"
+
+# Timed UI events
+SAVED_FLASH_END = pygame.USEREVENT + 1
+LAYER_FLASH_END = pygame.USEREVENT + 2
+AUTOSAVE = pygame.USEREVENT + 3
+
+# Autosave of the map, restored after a crash: snapshot, journal of the edits made since and time between flushes (ms)
+AUTOSAVE_FILE = "autosave.gwm"
+JOURNAL_FILE = "autosave.gwj"
+AUTOSAVE_INTERVAL = 5000
+
+# Above this amount of cells changed by an undo or redo, the whole drawing area is drawn again
+HISTORY_DIRTY_CELLS = 256
+
+# Most tiles shown at once in the drawing area, larger maps are scrolled through
+VIEW_W, VIEW_H = 30, 15
+# Tiles the view moves by on each arrow key press
+PAN_STEP = 4
+# Sizes in pixels of a tile on screen the view can be zoomed to, with the mouse wheel or the +/- keys
+ZOOM_LEVELS = (1, 2, 4, 8, 16, 32, 64)
+# Below this size, every tile is drawn as a single pixel of its color scaled up and the grid is hidden
+COLOR_MODE_SCALE = 8
+
 
 def main(w=30, h=15, scalingFactor=32):
-    # We'll always update the graphic window by hand
+    # We'll always update the graphic window by hand, one frame at a time
     auto_display_toggle(False)
 
-    W, H = w * scalingFactor, h * scalingFactor
+    W, H = min(w, VIEW_W) * scalingFactor, min(h, VIEW_H) * scalingFactor
     menuSize = Point(128, 90)
 
     init_graphic(W + 128, H + 90, "GWME v0.2", white)
@@ -14,18 +53,53 @@ def main(w=30, h=15, scalingFactor=32):
 
     draw_area = Button(Point(0, 0), "", W, H, black, white)
 
-    ghost = pygame.Surface((32, 32))
+    # Cursor overlay, keeps what is under the ghost so that moving it doesn't require redrawing the map
+    ghost = SaveUnder(scalingFactor, scalingFactor)
 
     # Load all the color buttons from the designated .blf (Button-Listing File) file
     blockButtons: List[Button] = load_buttons_from_file("buttons.blf", W + 32, 30)
     lenBB = len(blockButtons)
 
-    # Colors taken from the front-ground colors of the blockButtons list
-    colors: List[Color] = [blockButtons[i].color_fg for i in range(len(blockButtons))]
+    # Tile IDs, colors and names, from the same file (block button i paints tile ID i + 1)
+    registry = load_registry("buttons.blf")
+
+    # Tile images used on the map and on the block buttons, each set packed into a single surface
+    registry.attach_atlas(load_atlas(os.path.join("data", "raw")))
+    buttonAtlas = load_atlas(os.path.join("data", "contoured"))
+    for button in blockButtons:
+        if button.text.lower() in buttonAtlas:
+            button.image = buttonAtlas.area(button.text.lower())
+
+    # Index of the selected block button, the tile ID it paints is currentColor + 1 (0 being an empty cell)
     currentColor: int = 0
 
-    # Layers initialization with only one layer
-    layers: List[List[Tuple[Point, Color]]] = [[]]
+    # Layers initialization with only one layer, stored as chunks so that only the painted area takes memory
+    layers: List[ChunkedTileLayer] = [ChunkedTileLayer(w, h)]
+    # Memory-mapped map file the layers are views onto, if they were loaded from an uncompressed one
+    mappedMap: Optional[MappedMap] = None
+
+    # Get the map back if the editor crashed (its journal then goes on), then start autosaving every edit
+    journal = EditJournal(os.path.join(IO_DIRECTORY, JOURNAL_FILE), os.path.join(IO_DIRECTORY, AUTOSAVE_FILE),
+                          registry)
+    restored = None
+    try:
+        restored = restore_journal(journal)
+    except ValueError as e:
+        print("Could not restore the autosave: {0}".format(e))
+    if restored:
+        layers = restored
+    else:
+        journal.snapshot(layers)
+    set_interval(AUTOSAVE, AUTOSAVE_INTERVAL)
+
+    # Undo and redo history, one entry per stroke or clearing
+    history = EditHistory()
+
+    # Part of the map shown in the drawing area, moved with the arrow keys or by dragging with the middle button and
+    # zoomed with the mouse wheel or the +/- keys
+    camera = Camera(W, H, layers[0].w, layers[0].h, scalingFactor)
+    # Window point where the middle button was pressed and camera position at that time (None when not dragging)
+    panAnchor = None
     currentLayer: int = 0
     transparent: bool = False
 
@@ -33,9 +107,7 @@ def main(w=30, h=15, scalingFactor=32):
     saveButton = Button(Point(W - 210, H + menuSize.y // 3), "SAVE", 100, menuSize.y // 3, pygame.Color("#7DFF00"),
                         soft_black, True)
     # LOAD button
-    # loadButton = Button(Point(W - 100, H + menuSize.y // 3), "LOAD", 100, menuSize.y // 3, pygame.Color("#00BCFF"),
-    #                     soft_black, True)
-    loadButton = Button(Point(W - 100, H + menuSize.y // 3), "LOAD", 100, menuSize.y // 3, gray,
+    loadButton = Button(Point(W - 100, H + menuSize.y // 3), "LOAD", 100, menuSize.y // 3, pygame.Color("#00BCFF"),
                         soft_black, True)
     # QUIT button
     quitButton = Button(Point(W + 14, H + menuSize.y // 3), "QUIT", 100, menuSize.y // 3, pygame.Color("#FF0051"),
@@ -56,162 +128,316 @@ def main(w=30, h=15, scalingFactor=32):
     # Transparency toggle and layer indicator button
     alphaButton = Button(Point(W + 48, (H + menuSize.y) // 2 + 32), str(currentLayer), 32, 32, soft_black, white, True)
 
+    # Static parts of the menus and grid, drawn once
+    menuChrome = MenuChrome()
+    grid = GridOverlay()
+    # Floors below the current one, as shown in transparent mode
+    lowerFloors = LowerFloors()
+
+    # Every part of the window that has to be drawn again on the next refresh
+    dirty = DirtyRegions()
+    dirty.add(pygame.Rect(0, 0, W + menuSize.x, H + menuSize.y))
+    drawAreaRect = pygame.Rect(0, 0, W, H)
+    layerWidgets = [layer_upButton.rect(), alphaButton.rect(), layer_downButton.rect(), clearSingleButton.rect()]
+    savedTextRect = pygame.Rect(saveButton.P.x, saveButton.P.y + saveButton.h, saveButton.w, 17)
+
+    ghostCell = None
+    ghostStale = False
     checkSaveWatch = False
-    postEventRefresh = False
+
+    # Stroke being painted: tile painted (None when no button is held), mouse button, last cell, cells left to paint
+    strokeTile, strokeButton, strokeCell = None, None, None
+    strokeCells: List[Tuple[int, int]] = []
+    clock = pygame.time.Clock()
     while True:
         # region BasicWindow
         # ------------------------------------------------------------------------
 
-        # Draw the screen again if it needs to be refreshed
-        if postEventRefresh:
-            checkSaveWatch = refresh_screen(w, h, W, H, scalingFactor, menuSize, layers, currentLayer, transparent,
-                                            blockButtons, currentColor, layer_upButton, layer_downButton, alphaButton,
-                                            quitButton, saveButton, loadButton, clearButton, clearSingleButton, checkSaveWatch)
-            postEventRefresh = False
-
-            # If layer buttons are blue, change them on the next refresh
-            if layer_upButton.color_bg != white or layer_downButton.color_bg != white:
-                layer_upButton.color_bg, layer_downButton.color_bg = white, white
-                postEventRefresh = True
-
-        # Draw ghost
-        if draw_area.inside(get_mouse()):
-            draw_ghost(scalingFactor, colors[currentColor], blockButtons)
-            postEventRefresh = True
-
         clearSingleButton.text = "CLEAR L{0}".format(currentLayer)
 
-        display_all()
+        # The map may have been replaced (loaded, cleared, undone), the view has to stay inside it
+        if camera.set_map(layers[0].w, layers[0].h):
+            dirty.add(drawAreaRect)
+
+        # Everything drawn below is displayed at once, only where something was drawn
+        with frame():
+            # Hide ghost if it moved, changed or if what is under it is about to be drawn again
+            mouse = get_mouse()
+            newGhostCell = camera.cell(mouse) if draw_area.inside(mouse) else None
+            if newGhostCell is not None and not layers[0].inside(*newGhostCell):
+                newGhostCell = None
+            if ghost.P is not None and (newGhostCell != ghostCell or ghostStale or dirty.collides(ghost.rect())):
+                ghost.hide()
+            ghostCell = newGhostCell
+            ghostStale = False
+            # The ghost is as large as the tiles on screen
+            if ghost.P is None and ghost.w != camera.scale:
+                ghost = SaveUnder(camera.scale, camera.scale)
+
+            # Draw the parts of the screen that need to be refreshed
+            if dirty:
+                refresh_screen(W, H, camera, menuSize, layers, currentLayer, transparent, blockButtons, registry,
+                               currentColor, layer_upButton, layer_downButton, alphaButton, quitButton, saveButton,
+                               loadButton, clearButton, clearSingleButton, checkSaveWatch, menuChrome, grid,
+                               lowerFloors, dirty)
+                dirty.clear()
+
+            # Draw ghost
+            if ghostCell is not None and ghost.P is None:
+                ghost.show(Point(*camera.tile_rect(*ghostCell).topleft))
+                draw_ghost(ghost.P, camera.scale, currentColor + 1, registry)
 
         # ------------------------------------------------------------------------
         # endregion
 
         # region Get input
-        # region InputDown
-        input_down = get_input_down()
-        if input_down is not None:
-            keyData = input_down[0]
-            mouseDown = input_down[1]
-        else:
-            keyData, mouseDown = None, None
-        # endregion
-        # region MouseData
-        mousePos = pygame.mouse.get_pos()
-        mouseData: (List[bool], Point) = [pygame.mouse.get_pressed(), Point(mousePos[0], mousePos[1])]
-        # endregion
-        # endregion
-
-        # region MouseDown event
-        if mouseDown is not None:
-            if quitButton.inside(mouseDown[1]):
-                break
-            elif layer_upButton.inside(mouseDown[1]):
-                currentLayer = increment_layer(layers, currentLayer)
-                layer_upButton.color_bg = pygame.Color("#00BCFF")
-                postEventRefresh = True
-            elif layer_downButton.inside(mouseDown[1]):
-                currentLayer = decrement_layer(currentLayer)
-                layer_downButton.color_bg = pygame.Color("#00BCFF")
-                postEventRefresh = True
-            elif alphaButton.inside(mouseDown[1]):
-                transparent = toggle_transparency(alphaButton, transparent)
-                postEventRefresh = True
-            elif saveButton.inside(mouseDown[1]):
-                save_map(layers, -1 if transparent else currentLayer, blockButtons, w, h, W, H)
-                swatch_start()
-                checkSaveWatch = True
-                postEventRefresh = True
-            elif clearSingleButton.inside(mouseDown[1]):
-                layers[currentLayer] = []
-                postEventRefresh = True
-            elif clearButton.inside(mouseDown[1]):
-                layers = []
-                currentLayer = 0
-                postEventRefresh = True
-            # elif loadButton.inside(clickData[1]):
-            #     layers = load_map()
-            #     currentLayer = 0
-            else:
-                for i in range(len(blockButtons)):
-                    if blockButtons[i].inside(mouseDown[1]):
-                        currentColor = i
-                        postEventRefresh = True
-                        break
-        # endregion
-
-        # region KeyDown event
-        if keyData is not None:
-            if keyData in [K_z, K_w, K_q, K_a, K_s, K_d]:
-                if keyData in [K_z, K_w]:
-                    if currentColor >= 2:
-                        currentColor -= 2
-                    else:
-                        currentColor = lenBB - (currentColor if currentColor == 1 else 2)
-                elif keyData in [K_q, K_a]:
-                    if currentColor % 2 == 0 and currentColor < lenBB - 1:
-                        currentColor += 1
-                    elif currentColor % 2 == 1 and currentColor > 0:
-                        currentColor -= 1
-                elif keyData == K_s:
-                    if currentColor < lenBB - 2:
-                        currentColor += 2
-                    else:
-                        currentColor %= 2
-                else:
-                    if currentColor % 2 == 1 and currentColor > 0:
-                        currentColor -= 1
-                    elif currentColor % 2 == 0 and currentColor < lenBB - 1:
-                        currentColor += 1
-                postEventRefresh = True
-            elif keyData in [K_LSHIFT, K_LCTRL, K_LALT, K_t]:
-                if keyData == K_LSHIFT:
-                    currentLayer = increment_layer(layers, currentLayer)
+        # Sleep until something happens unless a button is held down or something is left to draw
+        events = get_events(0 if strokeTile is not None or dirty else IDLE_TIMEOUT)
+        if any(event.type == QUIT for event in events):
+            break
+
+        # Every event is handled in order so that no click or key press is lost, however slow the frame was
+        quitting = False
+        for event in events:
+            # region Timers
+            if event.type == SAVED_FLASH_END:
+                # Hide the SAVED! text once its time is up
+                checkSaveWatch = False
+                dirty.add(savedTextRect)
+            elif event.type == LAYER_FLASH_END:
+                # Layer buttons go back to white
+                layer_upButton.color_bg, layer_downButton.color_bg = white, white
+                dirty.add(layer_upButton.rect(), layer_downButton.rect())
+            elif event.type == AUTOSAVE:
+                journal.autosave(layers)
+            # endregion
+
+            # region Stroke
+            if strokeTile is not None:
+                # Every mouse sample of a drag is joined to the previous one, whatever the distance between them,
+                # only the cells shown in the drawing area being painted
+                if event.type == MOUSEMOTION:
+                    cell = camera.cell(Point(*event.pos))
+                    visible = camera.tiles_in_area(drawAreaRect)
+                    strokeCells.extend(c for c in line_cells(*strokeCell, *cell)[1:] if visible.collidepoint(c))
+                    strokeCell = cell
+                # The pending part of the stroke is painted before anything can change the current tile or layer
+                if event.type in (MOUSEBUTTONDOWN, MOUSEBUTTONUP, KEYDOWN) and strokeCells:
+                    paint_cells(layers, currentLayer, strokeCells, strokeTile, camera, dirty, journal, history,
+                                lowerFloors)
+                    strokeCells = []
+                if event.type == MOUSEBUTTONUP and event.button == strokeButton:
+                    strokeTile = None
+                    history.end_stroke()
+            # endregion
+
+            # region Panning
+            if panAnchor is not None:
+                if event.type == MOUSEMOTION:
+                    # The view follows the mouse tile by tile
+                    P, x, y = panAnchor
+                    dx, dy = (P.x - event.pos[0]) // camera.scale, (P.y - event.pos[1]) // camera.scale
+                    if camera.look_at(x + dx, y + dy):
+                        dirty.add(drawAreaRect)
+                elif event.type == MOUSEBUTTONUP and event.button == BUTTON_MIDDLE:
+                    panAnchor = None
+            # endregion
+
+            # region Zoom
+            # The cell under the mouse stays under it
+            if event.type == MOUSEWHEEL and event.y != 0 and draw_area.inside(get_mouse()):
+                if camera.zoom(step_zoom(camera.scale, 1 if event.y > 0 else -1), get_mouse()):
+                    dirty.add(drawAreaRect)
+                    if panAnchor is not None:
+                        panAnchor = (get_mouse(), camera.x, camera.y)
+            # endregion
+
+            down = input_down(event)
+            if down is None:
+                continue
+            keyData, mouseDown = down
+
+            # region MouseDown event
+            if mouseDown is not None:
+                if quitButton.inside(mouseDown[1]):
+                    quitting = True
+                    break
+                elif layer_upButton.inside(mouseDown[1]):
+                    currentLayer = increment_layer(layers, currentLayer, journal)
                     layer_upButton.color_bg = pygame.Color("#00BCFF")
-                elif keyData == K_LCTRL:
+                    set_timeout(LAYER_FLASH_END, 100)
+                    dirty.add(drawAreaRect, *layerWidgets)
+                elif layer_downButton.inside(mouseDown[1]):
                     currentLayer = decrement_layer(currentLayer)
                     layer_downButton.color_bg = pygame.Color("#00BCFF")
-                elif keyData == K_LALT:
+                    set_timeout(LAYER_FLASH_END, 100)
+                    dirty.add(drawAreaRect, *layerWidgets)
+                elif alphaButton.inside(mouseDown[1]):
+                    transparent = toggle_transparency(alphaButton, transparent)
+                    dirty.add(drawAreaRect, alphaButton.rect())
+                elif saveButton.inside(mouseDown[1]):
+                    mappedMap = save_map(layers, currentLayer, transparent, registry, journal, mappedMap)
+                    checkSaveWatch = True
+                    set_timeout(SAVED_FLASH_END, 1000)
+                    dirty.add(savedTextRect)
+                elif clearSingleButton.inside(mouseDown[1]):
+                    history.record_clear(currentLayer, layers[currentLayer])
+                    layers[currentLayer].clear()
+                    journal.record_clear(currentLayer)
+                    lowerFloors.invalidate(floor=currentLayer)
+                    dirty.add(drawAreaRect)
+                elif clearButton.inside(mouseDown[1]):
+                    # The map keeps its size, which may not be the one the editor started with
+                    mapW, mapH = layers[0].w, layers[0].h
+                    history.record_clear_all(layers, mapW, mapH)
+                    layers = [ChunkedTileLayer(mapW, mapH)]
+                    journal.record_clear_all(mapW, mapH)
                     currentLayer = 0
+                    lowerFloors.invalidate()
+                    dirty.add(drawAreaRect, *layerWidgets)
+                elif loadButton.inside(mouseDown[1]):
+                    loaded, mapped, source = load_map(registry)
+                    if loaded:
+                        if mappedMap is not None:
+                            mappedMap.close()
+                        layers, mappedMap = loaded, mapped
+                        # The journal starts from the loaded file, only maps loaded from images need a snapshot
+                        if source is not None:
+                            journal.rebase(source)
+                        else:
+                            journal.snapshot(layers)
+                        history.clear()
+                        currentLayer = 0
+                        lowerFloors.invalidate()
+                        dirty.add(drawAreaRect, *layerWidgets)
                 else:
-                    transparent = toggle_transparency(alphaButton, transparent)
-                postEventRefresh = True
+                    for i in range(len(blockButtons)):
+                        if blockButtons[i].inside(mouseDown[1]):
+                            dirty.add(blockButtons[currentColor].rect(), blockButtons[i].rect())
+                            currentColor = i
+                            ghostStale = True
+                            break
+            # endregion
+
+            # Start a stroke (left click paints, right click erases)
+            if mouseDown is not None and mouseDown[0] != BUTTON_MIDDLE and draw_area.inside(mouseDown[1]):
+                history.end_stroke()
+                strokeButton = mouseDown[0]
+                strokeTile = currentColor + 1 if strokeButton == BUTTON_LEFT else EMPTY_TILE
+                strokeCell = camera.cell(mouseDown[1])
+                strokeCells = [strokeCell]
+            # Start dragging the view (middle click)
+            elif mouseDown is not None and draw_area.inside(mouseDown[1]):
+                panAnchor = (mouseDown[1], camera.x, camera.y)
+
+            # region KeyDown event
+            if keyData is not None:
+                if keyData in [K_z, K_w, K_q, K_a, K_s, K_d]:
+                    dirty.add(blockButtons[currentColor].rect())
+                    if keyData in [K_z, K_w]:
+                        if currentColor >= 2:
+                            currentColor -= 2
+                        else:
+                            currentColor = lenBB - (currentColor if currentColor == 1 else 2)
+                    elif keyData in [K_q, K_a]:
+                        if currentColor % 2 == 0 and currentColor < lenBB - 1:
+                            currentColor += 1
+                        elif currentColor % 2 == 1 and currentColor > 0:
+                            currentColor -= 1
+                    elif keyData == K_s:
+                        if currentColor < lenBB - 2:
+                            currentColor += 2
+                        else:
+                            currentColor %= 2
+                    else:
+                        if currentColor % 2 == 1 and currentColor > 0:
+                            currentColor -= 1
+                        elif currentColor % 2 == 0 and currentColor < lenBB - 1:
+                            currentColor += 1
+                    dirty.add(blockButtons[currentColor].rect())
+                    ghostStale = True
+                elif keyData == K_g:
+                    grid.toggle()
+                    dirty.add(drawAreaRect)
+                elif keyData in [K_LEFT, K_RIGHT, K_UP, K_DOWN]:
+                    dx = PAN_STEP if keyData == K_RIGHT else -PAN_STEP if keyData == K_LEFT else 0
+                    dy = PAN_STEP if keyData == K_DOWN else -PAN_STEP if keyData == K_UP else 0
+                    if camera.pan(dx, dy):
+                        dirty.add(drawAreaRect)
+                elif keyData in [K_PLUS, K_EQUALS, K_KP_PLUS, K_MINUS, K_KP_MINUS]:
+                    # Zoom around the center of the view
+                    steps = -1 if keyData in [K_MINUS, K_KP_MINUS] else 1
+                    if camera.zoom(step_zoom(camera.scale, steps), Point(W // 2, H // 2)):
+                        dirty.add(drawAreaRect)
+                elif keyData in [K_u, K_r]:
+                    # Undo / redo
+                    layers, changes = history.undo(layers) if keyData == K_u else history.redo(layers)
+                    currentLayer = min(currentLayer, len(layers) - 1)
+                    if changes is None:
+                        # Whole floors changed
+                        journal.snapshot(layers)
+                        lowerFloors.invalidate()
+                        dirty.add(drawAreaRect, *layerWidgets)
+                    elif changes:
+                        journal.record_add_floor(len(layers))
+                        for floor, cells, tile in changes:
+                            journal.record_cells(floor, cells, tile)
+                            if len(cells) > HISTORY_DIRTY_CELLS:
+                                dirty.add(drawAreaRect)
+                                lowerFloors.invalidate(floor=floor)
+                            else:
+                                for x, y in cells:
+                                    dirty.add(camera.tile_rect(x, y))
+                                    lowerFloors.invalidate(camera.tile_rect(x, y), floor)
+                        dirty.add(*layerWidgets)
+                elif keyData in [K_LSHIFT, K_LCTRL, K_LALT, K_t]:
+                    if keyData == K_LSHIFT:
+                        currentLayer = increment_layer(layers, currentLayer, journal)
+                        layer_upButton.color_bg = pygame.Color("#00BCFF")
+                        set_timeout(LAYER_FLASH_END, 100)
+                    elif keyData == K_LCTRL:
+                        currentLayer = decrement_layer(currentLayer)
+                        layer_downButton.color_bg = pygame.Color("#00BCFF")
+                        set_timeout(LAYER_FLASH_END, 100)
+                    elif keyData == K_LALT:
+                        currentLayer = 0
+                    else:
+                        transparent = toggle_transparency(alphaButton, transparent)
+                    dirty.add(drawAreaRect, *layerWidgets)
+            # endregion
+
+        if quitting:
+            break
         # endregion
 
-        # region MousePressed
-        if (True in mouseData[0]) or mouseDown is not None:
-            # Draw area
-            if draw_area.inside(mouseData[1]):
-                lenLayer = len(layers[currentLayer])
-                # Left click
-                if mouseData[0][0] or (mouseDown is not None and mouseDown[0] == BUTTON_LEFT):
-                    i = 0
-                    while i < lenLayer:
-                        if layers[currentLayer][i][0] == Point(mouseData[1].x // scalingFactor,
-                                                               mouseData[1].y // scalingFactor):
-                            del layers[currentLayer][i]
-                            i = lenLayer
-                        i += 1
-                    layers[currentLayer].append((Point(mouseData[1].x // scalingFactor,
-                                                       mouseData[1].y // scalingFactor),
-                                                 colors[currentColor]))
-                # Right click
-                if mouseData[0][2] or (mouseDown is not None and mouseDown[0] == BUTTON_RIGHT):
-                    i = 0
-                    while i < lenLayer:
-                        if layers[currentLayer][i][0] == Point(mouseData[1].x // scalingFactor,
-                                                               mouseData[1].y // scalingFactor):
-                            del layers[currentLayer][i]
-                            i = lenLayer
-                        i += 1
+        # region Stroke painting
+        # The path of the mouse since the last frame is painted as a single edit
+        if strokeCells:
+            paint_cells(layers, currentLayer, strokeCells, strokeTile, camera, dirty, journal, history, lowerFloors)
+            strokeCells = []
+
+        # Don't paint faster than the screen can show it
+        if strokeTile is not None:
+            clock.tick(MAX_FPS)
         # endregion
 
+    # Edits of a memory-mapped map are written back to its file
+    if mappedMap is not None:
+        mappedMap.close()
+
+    # Nothing to restore when the editor was closed on purpose
+    set_interval(AUTOSAVE, 0)
+    journal.discard()
+
 
 # region Layer handling
 
 
-def increment_layer(layers, currentLayer):
+def increment_layer(layers, currentLayer, journal=None):
     if currentLayer == len(layers) - 1:
-        layers.append([])
+        layers.append(ChunkedTileLayer(layers[0].w, layers[0].h))
+        if journal is not None:
+            journal.record_add_floor(len(layers))
     currentLayer += 1
     return currentLayer
 
@@ -222,6 +448,24 @@ def decrement_layer(currentLayer):
     return currentLayer
 
 
+def paint_cells(layers, currentLayer, cells, tile, camera, dirty, journal, history, lowerFloors):
+    """
+    Paints tile on cells of the current layer as a single edit, records it in the journal and the undo history and
+    marks the cells that changed to be drawn again (including on the cached surface of the layer, if any)
+    """
+    layer = layers[currentLayer]
+    olds = {}
+    for x, y in cells:
+        if (x, y) not in olds and layer.inside(x, y):
+            olds[(x, y)] = layer.get(x, y)
+    changed = layer.set_cells(cells, tile)
+    journal.record_cells(currentLayer, changed, tile)
+    history.record_cells(currentLayer, changed, [olds[cell] for cell in changed], tile)
+    for x, y in changed:
+        dirty.add(camera.tile_rect(x, y))
+        lowerFloors.invalidate(camera.tile_rect(x, y), currentLayer)
+
+
 def toggle_transparency(alphaButton, transparent):
     transparent = not transparent
     if transparent:
@@ -236,15 +480,69 @@ def toggle_transparency(alphaButton, transparent):
 # region Drawing
 
 
-def refresh_screen(w, h, W, H, scalingFactor, menuSize, layers, currentLayer, transparent, blockButtons, currentColor,
-                   layer_upButton, layer_downButton, alphaButton, quitButton, saveButton, loadButton, clearButton, clearSingleButton, checkSaveWatch):
-    refresh_drawing_area(layers, currentLayer, transparent, blockButtons, w, h, W, H, scalingFactor)
-    return refresh_menus(W, H, menuSize, blockButtons, currentColor, currentLayer, layer_upButton, layer_downButton,
-                         alphaButton, quitButton, saveButton, loadButton, clearButton, clearSingleButton, checkSaveWatch)
+def refresh_screen(W, H, camera, menuSize, layers, currentLayer, transparent, blockButtons, registry, currentColor,
+                   layer_upButton, layer_downButton, alphaButton, quitButton, saveButton, loadButton, clearButton,
+                   clearSingleButton, checkSaveWatch, menuChrome, grid, lowerFloors, dirty):
+    """
+    Draws again every part of the window marked in dirty (the display itself is not updated)
+    """
+    drawingArea = pygame.Rect(0, 0, W, H)
+    menus = [pygame.Rect(W, 0, menuSize.x, H + menuSize.y), pygame.Rect(0, H, W + menuSize.x, menuSize.y)]
+
+    # Rasterize the static parts of the menus again if the window or the palette changed
+    if menuChrome.stale(W, H, menuSize, blockButtons):
+        menuChrome.build(W, H, menuSize, blockButtons, quitButton, saveButton, loadButton, clearButton)
+        dirty.add(*menus)
+
+    for rect in dirty.rects:
+        if rect.colliderect(drawingArea):
+            refresh_drawing_area(layers, currentLayer, transparent, registry, grid, camera, lowerFloors,
+                                 rect.clip(drawingArea))
+        if rect.collidelist(menus) != -1:
+            clip_display(rect)
+            refresh_menus(blockButtons, currentColor, currentLayer, layer_upButton, layer_downButton, alphaButton,
+                          saveButton, clearSingleButton, checkSaveWatch, menuChrome)
+            clip_display(None)
+
+
+class MenuChrome:
+    """
+    This class keeps the parts of the menus that never change between refreshes (panels, title, version, block
+    buttons and fixed buttons) rasterized, so that refreshing the menus only takes two blits and the dynamic widgets.
+    M.key identifies the window size and palette the chrome was drawn for (None if it was never drawn).
+    M.side is the surface of the side panel (above the bottom panel) and M.sideP its top-left point.
+    M.bottom is the surface of the bottom panel and M.bottomP its top-left point.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.side, self.sideP = None, None
+        self.bottom, self.bottomP = None, None
+
+    @staticmethod
+    def make_key(W, H, menuSize, blockButtons):
+        return W, H, menuSize.x, menuSize.y, tuple((b.text, b.P.x, b.P.y, tuple(b.color_fg)) for b in blockButtons)
 
+    def stale(self, W, H, menuSize, blockButtons):
+        return self.key != MenuChrome.make_key(W, H, menuSize, blockButtons)
 
-def refresh_menus(W, H, menuSize, blockButtons, currentColor, currentLayer, layer_upButton, layer_downButton,
-                  alphaButton, quitButton, saveButton, loadButton, clearButton, clearSingleButton, checkSaveWatch):
+    def build(self, W, H, menuSize, blockButtons, quitButton, saveButton, loadButton, clearButton):
+        """
+        Draws the static parts of the menus onto the window and keeps a copy of them
+        /!\\ Beware, the menus have to be refreshed entirely afterwards since the dynamic widgets get drawn over
+        """
+        clip_display(None)
+        draw_static_menus(W, H, menuSize, blockButtons, quitButton, saveButton, loadButton, clearButton)
+        self.side, self.sideP = capture_display(pygame.Rect(W, 0, menuSize.x, H)), Point(W, 0)
+        self.bottom, self.bottomP = capture_display(pygame.Rect(0, H, W + menuSize.x, menuSize.y)), Point(0, H)
+        self.key = MenuChrome.make_key(W, H, menuSize, blockButtons)
+
+    def draw(self):
+        display_image(self.side, self.sideP)
+        display_image(self.bottom, self.bottomP)
+
+
+def draw_static_menus(W, H, menuSize, blockButtons, quitButton, saveButton, loadButton, clearButton):
     # region Side
     # Block picker area
     draw_fill_rectangle(Point(W, 0), menuSize.x, H + menuSize.y, gray)
@@ -252,12 +550,6 @@ def refresh_menus(W, H, menuSize, blockButtons, currentColor, currentLayer, laye
     # Block buttons
     for button in blockButtons:
         button.draw(True)
-
-    # Selection highlighter
-    draw_rectangle(Point(blockButtons[0].P.x + (currentColor % 2) * blockButtons[0].w,
-                         blockButtons[0].P.y + (currentColor // 2) * blockButtons[0].h),
-                   blockButtons[0].w, blockButtons[0].h,
-                   yellow)
     # endregion
 
     # region Bottom
@@ -268,6 +560,34 @@ def refresh_menus(W, H, menuSize, blockButtons, currentColor, currentLayer, laye
     display_text("Golden Wind Map Editor", 52, Point(5, H + 5), white, True)
     display_text("v0.2", 16, Point(15, H + text_height("Golden Wind Map Editor", 52, True)), soft_black, True)
 
+    # SAVE button
+    saveButton.draw(False, True)
+
+    # LOAD button
+    loadButton.draw(False, True)
+
+    # QUIT button
+    quitButton.draw(False, True)
+
+    # CLEAR ALL button
+    clearButton.draw(False, True)
+    # endregion
+
+
+def refresh_menus(blockButtons, currentColor, currentLayer, layer_upButton, layer_downButton, alphaButton, saveButton,
+                  clearSingleButton, checkSaveWatch, menuChrome):
+    # Static parts
+    menuChrome.draw()
+
+    # region Side
+    # Selection highlighter
+    draw_rectangle(Point(blockButtons[0].P.x + (currentColor % 2) * blockButtons[0].w,
+                         blockButtons[0].P.y + (currentColor // 2) * blockButtons[0].h),
+                   blockButtons[0].w, blockButtons[0].h,
+                   yellow)
+    # endregion
+
+    # region Bottom
     # Layer handling
     arrowSize = 8
     layer_upButton.draw(True, False)
@@ -286,164 +606,401 @@ def refresh_menus(W, H, menuSize, blockButtons, currentColor, currentLayer, laye
               layer_downButton.P.y + arrowSize),
         layer_downButton.color_bg)
 
-    # SAVE button
-    saveButton.draw(False, True)
+    # SAVED! flash
     if checkSaveWatch:
-        if swatch_val() < 1000:
-            display_text_center("SAVED!", 12,
-                                Point(saveButton.P.x + saveButton.w // 2, saveButton.P.y + saveButton.h + 8),
-                                saveButton.color_fg)
-        else:
-            checkSaveWatch = False
-    # LOAD button
-    loadButton.draw(False, True)
-    display_text_center("WIP", 12, Point(loadButton.P.x + loadButton.w // 2, loadButton.P.y + loadButton.h + 8), black)
-
-    # QUIT button
-    quitButton.draw(False, True)
-
-    # CLEAR ALL button
-    clearButton.draw(False, True)
+        display_text_center("SAVED!", 12, Point(saveButton.P.x + saveButton.w // 2, saveButton.P.y + saveButton.h + 8),
+                            saveButton.color_fg)
 
     # CLEAR SINGLE button
     clearSingleButton.draw(False, True)
 
     # endregion
 
-    return checkSaveWatch
 
+def refresh_drawing_area(layers: List[ChunkedTileLayer], currentLayer: int, transparent: bool,
+                         registry: TileRegistry, grid: "GridOverlay", camera: "Camera", lowerFloors: "LowerFloors",
+                         area: pygame.Rect = None):
+    # Only the tiles overlapping area (the whole drawing area by default) are drawn again, whatever the map size
+    if area is None:
+        area = pygame.Rect(0, 0, camera.W, camera.H)
+    tiles = camera.tiles_in_area(area)
+    origin = Point(*camera.tile_rect(0, 0).topleft)
+    clip_display(area)
 
-def refresh_drawing_area(layers: List[List[Tuple[Point, Color]]], currentLayer: int, transparent: bool,
-                         buttons: List[Button], w: int, h: int, W: int, H: int, scalingFactor: int = 16):
-    # Erase everything
-    draw_fill_rectangle(Point(0, 0), W, H, white)
-    # Draw single layers or layer + all layers below but slightly transparent
+    # Draw single layers or layer + all layers below (kept drawn by lowerFloors) fading with depth
     if transparent and currentLayer > 0 and len(layers) > 1:
-        for i in range(currentLayer + 1):
-            # TODO make transparency work
-            # draw_layer(layers[i], buttons, map_from_to(i, 0, currentLayer, 0, 255), scalingFactor)
-            draw_layer(layers[i], buttons, 255, scalingFactor)
+        lowerFloors.draw(layers, currentLayer, registry, camera, area)
     else:
-        draw_layer(layers[currentLayer], buttons, 255, scalingFactor)
+        # Erase everything
+        draw_fill_rectangle(Point(area.x, area.y), area.w, area.h, white)
+    draw_layer(layers[currentLayer], registry, 255, camera.scale, tiles=tiles, origin=origin)
     # Draw grid
-    draw_grid(w, h, W, H, scalingFactor)
+    grid.draw(camera, area)
 
+    clip_display(None)
 
-def draw_grid(w: int, h: int, W: int, H: int, scalingFactor: int):
+
+class Camera:
+    """
+    This class defines the part of the map shown in the drawing area, which always starts on a whole tile.
+    Every conversion between window points and map cells goes through it.
+    C.x, C.y is the map cell shown at the top-left corner of the drawing area.
+    C.W, C.H is the size in pixels of the drawing area.
+    C.w, C.h is the size in tiles of the map.
+    C.scale is the size in pixels of a tile on screen.
+    """
+
+    def __init__(self, W: int, H: int, w: int, h: int, scale: int):
+        self.x, self.y = 0, 0
+        self.W, self.H = W, H
+        self.w, self.h = w, h
+        self.scale = scale
+
+    def __str__(self):
+        return "Camera ({0}, {1}) of {2}x{3} tiles at {4}px".format(self.x, self.y, self.w, self.h, self.scale)
+
+    def look_at(self, x: int, y: int):
+        """
+        Moves the view so that cell (x, y) is at its top-left corner, as close as the map allows
+
+        :return: True if the view moved
+        ///////////////
+        :rtype: bool
+        """
+        x = min(max(x, 0), max(self.w - self.W // self.scale, 0))
+        y = min(max(y, 0), max(self.h - self.H // self.scale, 0))
+        moved = (x, y) != (self.x, self.y)
+        self.x, self.y = x, y
+        return moved
+
+    def pan(self, dx: int, dy: int):
+        """
+        Moves the view by dx, dy tiles (see look_at)
+        """
+        return self.look_at(self.x + dx, self.y + dy)
+
+    def set_map(self, w: int, h: int):
+        """
+        Changes the size in tiles of the map, moving the view back inside it if needed
+
+        :return: True if the view has to be drawn again
+        ///////////////
+        :rtype: bool
+        """
+        resized = (w, h) != (self.w, self.h)
+        self.w, self.h = w, h
+        return self.look_at(self.x, self.y) or resized
+
+    def cell(self, P: Point):
+        """
+        Returns the map cell under window point P (possibly outside the map)
+
+        :rtype: (int, int)
+        """
+        return int(P.x) // self.scale + self.x, int(P.y) // self.scale + self.y
+
+    def tile_rect(self, x: int, y: int):
+        """
+        Returns the part of the window covered by cell (x, y)
+        """
+        return pygame.Rect((x - self.x) * self.scale, (y - self.y) * self.scale, self.scale, self.scale)
+
+    def tiles_in_area(self, area: pygame.Rect):
+        """
+        Returns the rectangle (in map cells) of every cell overlapping area (in window pixels)
+        """
+        x, y = area.x // self.scale, area.y // self.scale
+        return pygame.Rect(x + self.x, y + self.y, -(-area.right // self.scale) - x, -(-area.bottom // self.scale) - y)
+
+    def map_rect(self):
+        """
+        Returns the part of the window the whole map would cover
+        """
+        return pygame.Rect(-self.x * self.scale, -self.y * self.scale, self.w * self.scale, self.h * self.scale)
+
+    def zoom(self, scale: int, P: Point):
+        """
+        Changes the size in pixels of a tile on screen, keeping the cell under window point P under it (as close as
+        the map allows)
+
+        :return: True if the view changed
+        ///////////////
+        :rtype: bool
+        """
+        if scale == self.scale:
+            return False
+        x, y = self.cell(P)
+        self.scale = scale
+        self.look_at(x - int(P.x) // scale, y - int(P.y) // scale)
+        return True
+
+
+def step_zoom(scale: int, steps: int):
+    """
+    Returns the zoom level steps levels above the one closest to scale (below it if steps is negative)
+    """
+    i = min(range(len(ZOOM_LEVELS)), key=lambda i: abs(ZOOM_LEVELS[i] - scale))
+    return ZOOM_LEVELS[min(max(i + steps, 0), len(ZOOM_LEVELS) - 1)]
+
+
+class LowerFloors:
+    """
+    This class keeps the floors below the current one drawn, as seen through the drawing area, so that in transparent
+    mode only the current floor is drawn live on top of them.
+    Each floor is drawn once on its own surface, faded as a whole with set_alpha (the lower the floor, the fainter),
+    and only drawn again where it changes. The faded floors are then kept composited on a single surface.
+    L.key is the (camera position, tile size, drawing area size) the surfaces were drawn for.
+    L.floors maps each floor index to its surface, where empty cells are fully transparent.
+    L.staleFloors maps each floor index to the set of rectangles of its surface to draw again before it is used.
+    L.composite is the surface holding the floors below L.currentLayer faded over a white background.
+    L.currentLayer is the floor L.composite was composited for (None if it has to be composited again).
+    L.stale is the set of rectangles of L.composite to composite again before it is used.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.floors: Dict[int, pygame.Surface] = {}
+        self.staleFloors: Dict[int, DirtyRegions] = {}
+        self.composite = None
+        self.currentLayer = None
+        self.stale = DirtyRegions()
+
+    def invalidate(self, rect: pygame.Rect = None, floor: int = None):
+        """
+        Marks the part of the drawing area inside rect (default is all of it) to be drawn again, as floor (default is
+        every floor) changed there
+        """
+        if floor is None:
+            self.key = None
+        elif rect is None:
+            self.floors.pop(floor, None)
+            if self.currentLayer is not None and floor < self.currentLayer:
+                self.currentLayer = None
+        elif floor in self.floors:
+            self.staleFloors[floor].add(rect)
+            if self.currentLayer is not None and floor < self.currentLayer:
+                self.stale.add(rect)
+
+    def floor(self, layers: List[ChunkedTileLayer], i: int, registry: TileRegistry, camera: "Camera"):
+        """
+        Returns the surface of floor i, drawing it first where needed
+        """
+        S = self.floors.get(i)
+        if S is None:
+            S = pygame.Surface((camera.W, camera.H), pygame.SRCALPHA)
+            self.floors[i] = S
+            self.staleFloors[i] = DirtyRegions()
+            self.staleFloors[i].add(S.get_rect())
+
+        origin = Point(*camera.tile_rect(0, 0).topleft)
+        for rect in self.staleFloors[i].rects:
+            S.set_clip(rect)
+            S.fill((0, 0, 0, 0), rect)
+            draw_layer(layers[i], registry, 255, camera.scale, S, camera.tiles_in_area(rect), origin)
+        S.set_clip(None)
+        self.staleFloors[i].clear()
+        return S
+
+    def draw(self, layers: List[ChunkedTileLayer], currentLayer: int, registry: TileRegistry, camera: "Camera",
+             area: pygame.Rect = None):
+        """
+        Draws the part of the floors below currentLayer inside area (default is the whole drawing area) in a single
+        blit, updating the surfaces first if needed
+        """
+        W, H = camera.W, camera.H
+        key = (camera.x, camera.y, camera.scale, W, H)
+        if self.key != key:
+            self.floors.clear()
+            self.staleFloors.clear()
+            self.currentLayer = None
+            self.key = key
+        if self.composite is None or self.composite.get_size() != (W, H):
+            self.composite = pygame.Surface((W, H)).convert()
+            self.currentLayer = None
+        if self.currentLayer != currentLayer:
+            self.stale.clear()
+            self.stale.add(pygame.Rect(0, 0, W, H))
+            self.currentLayer = currentLayer
+
+        if self.stale:
+            floors = [self.floor(layers, i, registry, camera) for i in range(currentLayer)]
+            for i, S in enumerate(floors):
+                S.set_alpha(int(map_from_to(i + 1, 0, currentLayer + 1, 0, 255)))
+            for rect in self.stale.rects:
+                self.composite.fill(white, rect)
+                for S in floors:
+                    self.composite.blit(S, rect, rect)
+            self.stale.clear()
+
+        if area is None:
+            area = pygame.Rect(0, 0, W, H)
+        display_image(self.composite, Point(area.x, area.y), area)
+
+
+class GridOverlay:
+    """
+    This class keeps the grid of the drawing area rasterized on a colorkeyed surface, drawn again only when the
+    size of the drawing area or the scale of the tiles changes (the view always starts on a whole tile).
+    G.key is the (W, H, scale) the grid was drawn for (None if it was never drawn).
+    G.surface is the surface holding the grid lines, every other pixel being transparent.
+    G.visible is False when the grid is hidden.
+    """
+
+    def __init__(self, visible: bool = True):
+        self.key = None
+        self.surface = None
+        self.visible = visible
+
+    def toggle(self):
+        self.visible = not self.visible
+
+    def draw(self, camera: Camera, area: pygame.Rect = None):
+        """
+        Draws the part of the grid inside area (default is the whole drawing area) and the map in a single blit
+        """
+        if not self.visible or camera.scale < COLOR_MODE_SCALE:
+            return
+        W, H, scale = camera.W, camera.H, camera.scale
+        if self.key != (W, H, scale):
+            self.surface = pygame.Surface((W, H)).convert()
+            self.surface.fill(black)
+            self.surface.set_colorkey(black)
+            draw_grid(-(-W // scale), -(-H // scale), W, H, scale, self.surface)
+            self.key = (W, H, scale)
+        if area is None:
+            area = pygame.Rect(0, 0, W, H)
+        area = area.clip(camera.map_rect())
+        display_image(self.surface, Point(area.x, area.y), area)
+
+
+def draw_grid(w: int, h: int, W: int, H: int, scalingFactor: int, S: pygame.Surface = PYGAME_SDL_WINDOW):
     for i in range(h):
-        draw_line(Point(0, i * scalingFactor), Point(W, i * scalingFactor), gray)
+        draw_fill_rectangle(Point(0, i * scalingFactor), W, 1, gray, S)
     for j in range(w):
-        draw_line(Point(j * scalingFactor, 0), Point(j * scalingFactor, H), gray)
+        draw_fill_rectangle(Point(j * scalingFactor, 0), 1, H, gray, S)
 
 
-def draw_layer(layer: List[Tuple[Point, Color]], buttons: List[Button], transparency: int = 255,
-               scalingFactor: int = 1, S: pygame.Surface = PYGAME_SDL_WINDOW):
+def draw_layer(layer: ChunkedTileLayer, registry: TileRegistry, transparency: int = 255,
+               scalingFactor: int = 1, S: pygame.Surface = PYGAME_SDL_WINDOW, tiles: pygame.Rect = None,
+               origin: Point = None):
     """
     Draw a single layer onto the graphic window
-    :param layer: list composed of coordinate and color data
-    :param buttons: list of color buttons used for finding the right image
+    :param layer: grid of tile IDs
+    :param registry: tile registry giving the image and color of each tile ID
     :param transparency: transparency of colors/images
     :param scalingFactor: how large to draw the pixels
     :param S: surface on which to draw (default is entire window)
+    :param tiles: only the tiles inside this rectangle are drawn (default is every tile)
+    :param origin: point of S where the top-left corner of the layer is drawn (default is the top-left corner of S)
     """
-    if transparency == 255:
-        if scalingFactor > 1:
-            if scalingFactor == 32:
-                for pixel in layer:
-                    load_image(get_path_from_color(pixel[1], buttons),
-                               Point(pixel[0].x * scalingFactor, pixel[0].y * scalingFactor))
-            else:
-                for pixel in layer:
-                    draw_fill_rectangle(Point(pixel[0].x * scalingFactor, pixel[0].y * scalingFactor),
-                                        scalingFactor,
-                                        scalingFactor, pixel[1])
-        else:
-            for pixel in layer:
-                draw_fill_rectangle(pixel[0], 1, 1, pixel[1], S)
+    ox, oy = (0, 0) if origin is None else (int(origin.x), int(origin.y))
+    if scalingFactor >= COLOR_MODE_SCALE:
+        for x, y, tile in layer.items(tiles):
+            registry.blit(tile, ox + x * scalingFactor, oy + y * scalingFactor, S, transparency != 255, scalingFactor)
     else:
-        if scalingFactor > 1:
-            if scalingFactor == 32:
-                for pixel in layer:
-                    load_image_alpha(get_path_from_color(pixel[1], buttons),
-                                     Point(pixel[0].x * scalingFactor, pixel[0].y * scalingFactor))
-            else:
-                for pixel in layer:
-                    draw_fill_rectangle(Point(pixel[0].x * scalingFactor, pixel[0].y * scalingFactor),
-                                        scalingFactor,
-                                        scalingFactor,
-                                        pygame.Color(colordata_to_colorhex(pixel[1].r, pixel[1].g, pixel[1].b)))
-        else:
-            for pixel in layer:
-                draw_fill_rectangle(pixel[0], 1, 1, pygame.Color(colordata_to_colorhex(pixel[1].r, pixel[1].g, pixel[1].b)), S)
-
-
-def draw_ghost(scalingFactor, col, buttons):
-    mousePos = get_mouse()
-    processedMousePos = Point((mousePos.x // scalingFactor) * scalingFactor,
-                              (mousePos.y // scalingFactor) * scalingFactor)
-    load_image(get_path_from_color(col, buttons), processedMousePos)
+        # One pixel per tile scaled up in a single blit, empty cells being left untouched
+        if tiles is None:
+            tiles = pygame.Rect(0, 0, layer.w, layer.h)
+        ids = layer.area_array(tiles)
+        colors = registry.to_surface(ids).convert_alpha()
+        pygame.surfarray.pixels_alpha(colors)[:] = np.where(ids != EMPTY_TILE, 255, 0).T
+        S.blit(pygame.transform.scale(colors, (tiles.w * scalingFactor, tiles.h * scalingFactor)),
+               (ox + tiles.x * scalingFactor, oy + tiles.y * scalingFactor))
+
+
+def draw_ghost(processedMousePos, scalingFactor, tile, registry):
+    col = registry.color(tile)
+    image, area = registry.scaled(tile, scalingFactor)
+    display_image(image, processedMousePos, area)
 
     if col != red and col != pygame.Color("#FF0051"):
         draw_rectangle(processedMousePos, scalingFactor, scalingFactor, red)
     else:
         draw_rectangle(processedMousePos, scalingFactor, scalingFactor, yellow)
 
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
-
 
 # endregion
 
 # region Saving and loading
 
-def get_path_from_color(col, buttons):
-    for i in range(len(buttons)):
-        if col == buttons[i].color_fg:
-            L = buttons[i].imagePath.split("\\")
-            return "data\\raw\\" + L[-1]
-    return "-1"
+def save_map(layers, currentLayer, transparent, registry, journal, mappedMap=None):
+    """
+    Saves the whole map to MAP_FILE and the image of every layer to layer_0.png, layer_1.png... in IO_DIRECTORY
+    In transparent mode, the layers up to the current one are also squashed together into SQUASHED_FILE
+    A memory-mapped map is only flushed if its floors didn't change, otherwise it is closed and written again
+    (still uncompressed)
+    The journal starts over from MAP_FILE once it is written, the images being exported afterwards
+
+    :return: mapping the layers are still views onto, None if there is none anymore
+    ///////////////
+    :rtype: MappedMap
+    """
+    # Create output directory if there is none
+    if not os.path.isdir(IO_DIRECTORY):
+        os.mkdir(IO_DIRECTORY)
 
+    # MAP_FILE may be the base of the journal: the journal has to hold every edit before MAP_FILE does, otherwise a
+    # crash before the journal starts over would replay older edits over the newer ones (see EditJournal.snapshot)
+    path = os.path.join(IO_DIRECTORY, MAP_FILE)
+    journal.flush()
 
-def save_map(layers, currentLayer, buttons, w, h, W, H):
-    # Initialize surface to draw on and save
-    S = pygame.Surface((w, h))
+    # Whole map, lossless
+    if mappedMap is not None and mappedMap.holds(layers):
+        mappedMap.flush()
+    else:
+        compressed = mappedMap is None
+        if mappedMap is not None:
+            mappedMap.close(True)
+            mappedMap = None
+        save_gwm(path, layers, registry, compressed)
 
-    # Create output directory if there is none
-    if not os.path.isdir("IO\\"):
-        os.mkdir("IO\\")
+    # The saved map holds every edit, the journal starts over from it
+    journal.rebase(path)
 
-    if currentLayer != -1:
-        draw_fill_rectangle(Point(0, 0), W, H, white, S)
-        draw_layer(layers[currentLayer], buttons, 255, 1, S)
-        pygame.image.save(S, "IO\\layer_{0}.png".format(currentLayer))
-    else:
-        draw_fill_rectangle(Point(0, 0), W, H, white)
-        for i in range(currentLayer + 1):
-            if layers[i]:
-                draw_layer(layers[i], buttons, 255, 1, S)
-                pygame.image.save(S, "IO\\layers_{0}.png".format(i))
-
-
-def colordata_to_colorhex(r, g, b):
-    return "#{0}{1}{2}".format(hex(r)[2:], hex(b)[2:], hex(g)[2:])
-
-
-# TODO finish load_map() for v0.2
-# def load_map():
-#     BASE_PATH = "IO\\layer_"
-#     layers = []
-#     n = 0
-#     while os.path.isfile(BASE_PATH + "{0}.png".format(n)):
-#         S = pygame.image.load(BASE_PATH + "{0}.png".format(n))
-#         layers.append([])
-#         for j in range(S.get_height()):
-#             for i in range(S.get_width()):
-#                 pixelColor = S.get_at((i,j))
-#                 if pixelColor
-#                 layers[-1].append((Point(i, j), S.get_at((i, j))))
-#         n += 1
-#     return layers if n > 0 else [[]]
+    try:
+        # Images of the layers, one pixel per tile
+        export_floors(layers, registry, IO_DIRECTORY, composite=SQUASHED_FILE if transparent else None,
+                      top=currentLayer)
+
+        # Images of layers that no longer exist would be loaded with the others
+        n = len(layers)
+        while os.path.isfile(os.path.join(IO_DIRECTORY, LAYER_FILE.format(n))):
+            os.remove(os.path.join(IO_DIRECTORY, LAYER_FILE.format(n)))
+            n += 1
+    except (OSError, pygame.error) as e:
+        print("Could not export the images of the map: {0}".format(e))
+
+    return mappedMap
+
+
+def load_map(registry):
+    """
+    Loads the map saved in IO_DIRECTORY, from MAP_FILE if it can be read (memory-mapping it if it is uncompressed),
+    otherwise from the images layer_0.png, layer_1.png... (stopping at the first missing one)
+
+    :param registry: tiles the colors of the images are looked up in
+    ///////////////
+    :type registry: TileRegistry
+    ///////////////
+    :return: loaded layers (empty if there is no saved layer or if they can't be loaded), the mapping they are views
+             onto (or None) and the .gwm file they were loaded from (None if they were loaded from images)
+    ///////////////
+    :rtype: (List[ChunkedTileLayer], MappedMap, str)
+    """
+    path = os.path.join(IO_DIRECTORY, MAP_FILE)
+    if os.path.isfile(path):
+        try:
+            return open_gwm(path, registry) + (path,)
+        except ValueError as e:
+            print("Could not load {0}: {1}".format(path, e))
+
+    try:
+        return load_floors(IO_DIRECTORY, registry), None, None
+    except ValueError as e:
+        print("Could not load the map from its images: {0}".format(e))
+        return [], None, None
 
 # endregion
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+from math import ceil, sqrt
+from typing import *
+
+import pygame
+
+ATLAS_CACHE_DIRECTORY = os.path.join("data", "atlas")
+ATLAS_FORMAT_VERSION = 1
+
+
+class TileAtlas:
+    """
+    This class defines a set of tile images packed into a single surface.
+    A.name is the name of the tile set (i.e. the name of its source directory).
+    A.surface is the packed surface holding every tile.
+    A.rects maps each tile name (file name without extension) to its source rect inside A.surface.
+    """
+
+    def __init__(self, name: str, surface: pygame.Surface, rects: Dict[str, pygame.Rect]):
+        self.name = name
+        self.surface = surface
+        self.rects = rects
+        self.surface_alpha = surface
+
+        # Convert once to the display format if there is a display to convert to
+        if pygame.display.get_surface() is not None:
+            self.surface = surface.convert()
+            self.surface_alpha = surface.convert_alpha()
+
+    def __contains__(self, name: str):
+        return name in self.rects
+
+    def area(self, name: str, alpha: bool = False):
+        """
+        Returns the (surface, rect) pair needed to blit tile name
+
+        :param name: tile name
+        :param alpha: per-pixel alpha is kept if True
+        ///////////////
+        :type name: str
+        :type alpha: bool
+        ///////////////
+        :return: atlas surface and source rect of the tile
+        ///////////////
+        :rtype: (Surface, Rect)
+        """
+        return (self.surface_alpha if alpha else self.surface), self.rects[name]
+
+
+def list_tiles(directory: str):
+    """
+    Returns the sorted paths of the .png files of a tile directory
+
+    :param directory: tile directory
+    ///////////////
+    :type directory: str
+    ///////////////
+    :rtype: List[str]
+    """
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.lower().endswith(".png"))
+
+
+def tile_manifest(paths: List[str]):
+    """
+    Returns the name, size and modification time of the given files, which change whenever a file is modified
+    (only their metadata is read, unlike hash_tiles)
+
+    :param paths: file paths
+    ///////////////
+    :type paths: List[str]
+    ///////////////
+    :rtype: List[[str, int, int]]
+    """
+    manifest = []
+    for path in paths:
+        stat = os.stat(path)
+        manifest.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return manifest
+
+
+def find_atlas(name: str, cacheDirectory: str):
+    """
+    Returns the path without extension of the cached atlas of tile set name, None if there is none
+    (save_atlas keeps a single atlas per tile set)
+
+    :param name: tile set name
+    :param cacheDirectory: directory in which packed atlases are kept
+    ///////////////
+    :type name: str
+    :type cacheDirectory: str
+    ///////////////
+    :rtype: str
+    """
+    if not os.path.isdir(cacheDirectory):
+        return None
+    for f in sorted(os.listdir(cacheDirectory)):
+        stem, extension = os.path.splitext(f)
+        if extension == ".json" and stem.rsplit("_", 1)[0] == name:
+            return os.path.join(cacheDirectory, stem)
+    return None
+
+
+def hash_tiles(paths: List[str]):
+    """
+    Returns a hash of the names and contents of the given files
+
+    :param paths: file paths
+    ///////////////
+    :type paths: List[str]
+    ///////////////
+    :rtype: str
+    """
+    sha = hashlib.sha1(str(ATLAS_FORMAT_VERSION).encode())
+    for path in paths:
+        sha.update(os.path.basename(path).encode())
+        with open(path, "rb") as file:
+            sha.update(file.read())
+    return sha.hexdigest()
+
+
+def pack_tiles(images: Dict[str, pygame.Surface]):
+    """
+    Packs images in rows (shelf packing), the row width being chosen to keep the atlas roughly square
+
+    :param images: tile name -> image
+    ///////////////
+    :type images: Dict[str, Surface]
+    ///////////////
+    :return: packed surface and tile name -> source rect
+    ///////////////
+    :rtype: (Surface, Dict[str, Rect])
+    """
+    if not images:
+        return pygame.Surface((1, 1), pygame.SRCALPHA), {}
+
+    names = sorted(images, key=lambda n: (-images[n].get_height(), n))
+    maxWidth = max(max(i.get_width() for i in images.values()),
+                   int(ceil(sqrt(len(images)))) * max(i.get_width() for i in images.values()))
+
+    rects: Dict[str, pygame.Rect] = {}
+    x, y, rowHeight = 0, 0, 0
+    for name in names:
+        w, h = images[name].get_size()
+        if x + w > maxWidth:
+            x, y, rowHeight = 0, y + rowHeight, 0
+        rects[name] = pygame.Rect(x, y, w, h)
+        x += w
+        rowHeight = max(rowHeight, h)
+
+    surface = pygame.Surface((max(r.right for r in rects.values()), max(r.bottom for r in rects.values())),
+                             pygame.SRCALPHA)
+    surface.fill((0, 0, 0, 0))
+    for name, rect in rects.items():
+        surface.blit(images[name], rect)
+    return surface, rects
+
+
+def load_atlas(directory: str, cacheDirectory: str = ATLAS_CACHE_DIRECTORY):
+    """
+    Returns the atlas of the tiles of directory
+    The packed atlas is cached on disk under cacheDirectory, keyed by a hash of the tiles, and only rebuilt
+    when a tile is added, removed or modified
+    The tiles are only read (and hashed) if their names, sizes or modification times changed since the atlas was
+    cached, so that a usual start only opens the cached atlas and its index
+
+    :param directory: tile directory (e.g. data/raw)
+    :param cacheDirectory: directory in which packed atlases are kept
+    ///////////////
+    :type directory: str
+    :type cacheDirectory: str
+    ///////////////
+    :rtype: TileAtlas
+    """
+    name = os.path.basename(os.path.normpath(directory))
+    paths = list_tiles(directory)
+    manifest = tile_manifest(paths)
+
+    base = find_atlas(name, cacheDirectory)
+    meta = None
+    if base is not None and os.path.isfile(base + ".png"):
+        with open(base + ".json", "r") as file:
+            meta = json.load(file)
+        if meta.get("version") == ATLAS_FORMAT_VERSION and meta.get("manifest") == manifest:
+            return TileAtlas(name, pygame.image.load(base + ".png"), atlas_rects(meta))
+
+    # The tiles may have been touched without changing (e.g. checked out again): only their content counts
+    digest = hash_tiles(paths)
+    if meta is not None and meta.get("hash") == digest:
+        save_index(base, digest, manifest, atlas_rects(meta))
+        return TileAtlas(name, pygame.image.load(base + ".png"), atlas_rects(meta))
+
+    surface, rects = build_atlas(paths)
+    save_atlas(os.path.join(cacheDirectory, "{0}_{1}".format(name, digest[:16])), digest, manifest, surface, rects)
+    return TileAtlas(name, surface, rects)
+
+
+def atlas_rects(meta: Dict[str, Any]):
+    """
+    Returns the tile name -> source rect of the index of a cached atlas
+
+    :rtype: Dict[str, Rect]
+    """
+    return {n: pygame.Rect(r) for n, r in meta["tiles"].items()}
+
+
+def build_atlas(paths: List[str]):
+    """
+    Loads and packs the given tile images
+
+    :param paths: tile image paths
+    ///////////////
+    :type paths: List[str]
+    ///////////////
+    :return: packed surface and tile name -> source rect
+    ///////////////
+    :rtype: (Surface, Dict[str, Rect])
+    """
+    images = {os.path.splitext(os.path.basename(p))[0].lower(): pygame.image.load(p) for p in paths}
+    return pack_tiles(images)
+
+
+def save_atlas(base: str, digest: str, manifest: List[List], surface: pygame.Surface,
+               rects: Dict[str, pygame.Rect]):
+    """
+    Writes a packed atlas and its index to base.png and base.json, removing outdated atlases of the same set
+
+    :param base: output path without extension
+    :param digest: hash of the tiles the atlas was built from
+    :param manifest: names, sizes and modification times of the tiles the atlas was built from (see tile_manifest)
+    :param surface: packed surface
+    :param rects: tile name -> source rect
+    ///////////////
+    :type base: str
+    :type digest: str
+    :type manifest: List[[str, int, int]]
+    :type surface: Surface
+    :type rects: Dict[str, Rect]
+    """
+    directory, fileName = os.path.split(base)
+    setName = fileName.rsplit("_", 1)[0]
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for f in os.listdir(directory):
+        stem = os.path.splitext(f)[0]
+        if stem != fileName and stem.rsplit("_", 1)[0] == setName:
+            os.remove(os.path.join(directory, f))
+
+    pygame.image.save(surface, base + ".png")
+    save_index(base, digest, manifest, rects)
+
+
+def save_index(base: str, digest: str, manifest: List[List], rects: Dict[str, pygame.Rect]):
+    """
+    Writes the index of a packed atlas to base.json (see save_atlas)
+    """
+    with open(base + ".json", "w") as file:
+        json.dump({"version": ATLAS_FORMAT_VERSION, "hash": digest, "manifest": manifest,
+                   "tiles": {n: list(r) for n, r in rects.items()}}, file, indent=1)
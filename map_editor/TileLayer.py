@@ -0,0 +1,513 @@
+from typing import *
+
+import numpy as np
+
+# Tile ID of a cell with nothing painted on it
+EMPTY_TILE = 0
+
+
+class TileLayer:
+    """
+    This class defines a single floor of the map as a dense grid of tile IDs (one uint8 per cell).
+    L.w is the width of layer L in tiles.
+    L.h is the height of layer L in tiles.
+    L.tiles is the (h, w) array of tile IDs of L, EMPTY_TILE marking an empty cell.
+    """
+
+    def __init__(self, w: int, h: int, tiles: np.ndarray = None):
+        self.w = w
+        self.h = h
+        if tiles is None:
+            tiles = np.zeros((h, w), dtype=np.uint8)
+        self.tiles = tiles
+
+    def __str__(self):
+        return "TileLayer {0}x{1} ({2} tiles)".format(self.w, self.h, self.count())
+
+    def inside(self, x: int, y: int):
+        return 0 <= x < self.w and 0 <= y < self.h
+
+    def get(self, x: int, y: int):
+        """
+        Returns the tile ID at (x, y)
+
+        :param x: x-coordinate
+        :param y: y-coordinate
+        ///////////////
+        :type x: int
+        :type y: int
+        ///////////////
+        :return: tile ID, EMPTY_TILE if nothing is painted there
+        ///////////////
+        :rtype: int
+        """
+        return int(self.tiles[y, x])
+
+    def set(self, x: int, y: int, tile: int):
+        """
+        Paints tile at (x, y)
+
+        :param x: x-coordinate
+        :param y: y-coordinate
+        :param tile: tile ID
+        ///////////////
+        :type x: int
+        :type y: int
+        :type tile: int
+        ///////////////
+        :return: True if the layer changed
+        ///////////////
+        :rtype: bool
+        """
+        if self.tiles[y, x] == tile:
+            return False
+        self.tiles[y, x] = tile
+        return True
+
+    def erase(self, x: int, y: int):
+        """
+        Empties cell (x, y)
+
+        :param x: x-coordinate
+        :param y: y-coordinate
+        ///////////////
+        :type x: int
+        :type y: int
+        ///////////////
+        :return: True if the layer changed
+        ///////////////
+        :rtype: bool
+        """
+        return self.set(x, y, EMPTY_TILE)
+
+    def set_cells(self, cells: Iterable[Tuple[int, int]], tile: int):
+        """
+        Paints tile on every cell of cells lying inside the layer, as a single edit
+
+        :param cells: (x, y) coordinates of the cells to paint
+        :param tile: tile ID (EMPTY_TILE to erase)
+        ///////////////
+        :type cells: Iterable[(int, int)]
+        :type tile: int
+        ///////////////
+        :return: coordinates of the cells that changed
+        ///////////////
+        :rtype: List[(int, int)]
+        """
+        return [(x, y) for x, y in cells if self.inside(x, y) and self.set(x, y, tile)]
+
+    def clear(self):
+        """
+        Empties every cell
+        """
+        self.tiles.fill(EMPTY_TILE)
+
+    def copy(self):
+        return TileLayer(self.w, self.h, self.tiles.copy())
+
+    def count(self):
+        """
+        Returns the amount of painted cells
+
+        :rtype: int
+        """
+        return int(np.count_nonzero(self.tiles))
+
+    def is_empty(self):
+        return not self.tiles.any()
+
+    def items(self, area=None):
+        """
+        Iterates over the painted cells as (x, y, tile) triples, row by row
+
+        :param area: only the cells inside this (x, y, w, h) rectangle are returned (default is every cell)
+        ///////////////
+        :type area: Rect
+        ///////////////
+        :rtype: Iterator[(int, int, int)]
+        """
+        x0, y0, x1, y1 = 0, 0, self.w, self.h
+        if area is not None:
+            x, y, w, h = area
+            x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, self.w), min(y + h, self.h)
+        if x0 >= x1 or y0 >= y1:
+            return
+        sub = self.tiles[y0:y1, x0:x1]
+        ys, xs = np.nonzero(sub)
+        yield from zip((xs + x0).tolist(), (ys + y0).tolist(), sub[ys, xs].tolist())
+
+    def to_array(self):
+        """
+        Returns the (h, w) array of tile IDs (not a copy)
+
+        :rtype: np.ndarray
+        """
+        return self.tiles
+
+    def area_array(self, area):
+        """
+        Returns a new (h, w) array of the tile IDs inside the (x, y, w, h) rectangle area, cells outside the layer
+        being EMPTY_TILE
+
+        :param area: rectangle in tiles
+        ///////////////
+        :type area: Rect
+        ///////////////
+        :rtype: np.ndarray
+        """
+        x, y, w, h = area
+        tiles = np.zeros((h, w), dtype=np.uint8)
+        x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, self.w), min(y + h, self.h)
+        if x0 < x1 and y0 < y1:
+            tiles[y0 - y:y1 - y, x0 - x:x1 - x] = self.tiles[y0:y1, x0:x1]
+        return tiles
+
+    @staticmethod
+    def from_array(tiles: np.ndarray):
+        """
+        Returns a layer holding a copy of the (h, w) array of tile IDs tiles
+
+        :param tiles: tile IDs
+        ///////////////
+        :type tiles: np.ndarray
+        ///////////////
+        :rtype: TileLayer
+        """
+        h, w = tiles.shape
+        return TileLayer(w, h, np.array(tiles, dtype=np.uint8))
+
+    def to_pixels(self):
+        """
+        Returns the painted cells in the ((x, y), tile) list format
+
+        :rtype: List[((int, int), int)]
+        """
+        return [((x, y), tile) for x, y, tile in self.items()]
+
+    @staticmethod
+    def from_pixels(w: int, h: int, pixels: Iterable):
+        """
+        Returns a w*h layer built from ((x, y), tile) pairs
+
+        :param w: width in tiles
+        :param h: height in tiles
+        :param pixels: ((x, y), tile) pairs
+        ///////////////
+        :type w: int
+        :type h: int
+        :type pixels: Iterable[((int, int), int)]
+        ///////////////
+        :rtype: TileLayer
+        """
+        layer = TileLayer(w, h)
+        for (x, y), tile in pixels:
+            layer.set(x, y, tile)
+        return layer
+
+
+# Size (in tiles) of the square chunks of a ChunkedTileLayer
+CHUNK_SIZE = 32
+
+
+class ChunkedTileLayer:
+    """
+    This class defines a single floor of the map stored as CHUNK_SIZE*CHUNK_SIZE chunks of tile IDs.
+    A chunk is only allocated once something is painted in it and freed as soon as it is empty again,
+    so memory grows with the painted area instead of the size of the map.
+    It has the same interface as TileLayer.
+    L.w is the width of layer L in tiles.
+    L.h is the height of layer L in tiles.
+    L.chunks maps the (cx, cy) coordinates of each allocated chunk to its (CHUNK_SIZE, CHUNK_SIZE) array.
+    L.counts maps the (cx, cy) coordinates of each allocated chunk to its amount of painted cells.
+    """
+
+    def __init__(self, w: int, h: int):
+        self.w = w
+        self.h = h
+        self.chunks: Dict[Tuple[int, int], np.ndarray] = {}
+        self.counts: Dict[Tuple[int, int], int] = {}
+
+    def __str__(self):
+        return "ChunkedTileLayer {0}x{1} ({2} tiles in {3} chunks)".format(self.w, self.h, self.count(),
+                                                                          len(self.chunks))
+
+    def inside(self, x: int, y: int):
+        return 0 <= x < self.w and 0 <= y < self.h
+
+    def get(self, x: int, y: int):
+        """
+        Returns the tile ID at (x, y)
+
+        :param x: x-coordinate
+        :param y: y-coordinate
+        ///////////////
+        :type x: int
+        :type y: int
+        ///////////////
+        :return: tile ID, EMPTY_TILE if nothing is painted there
+        ///////////////
+        :rtype: int
+        """
+        chunk = self.chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if chunk is None:
+            return EMPTY_TILE
+        return int(chunk[y % CHUNK_SIZE, x % CHUNK_SIZE])
+
+    def set(self, x: int, y: int, tile: int):
+        """
+        Paints tile at (x, y), allocating or freeing its chunk if needed
+
+        :param x: x-coordinate
+        :param y: y-coordinate
+        :param tile: tile ID
+        ///////////////
+        :type x: int
+        :type y: int
+        :type tile: int
+        ///////////////
+        :return: True if the layer changed
+        ///////////////
+        :rtype: bool
+        """
+        key = (x // CHUNK_SIZE, y // CHUNK_SIZE)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            if tile == EMPTY_TILE:
+                return False
+            chunk = self.chunks[key] = np.zeros((CHUNK_SIZE, CHUNK_SIZE), dtype=np.uint8)
+            self.counts[key] = 0
+
+        old = chunk[y % CHUNK_SIZE, x % CHUNK_SIZE]
+        if old == tile:
+            return False
+        chunk[y % CHUNK_SIZE, x % CHUNK_SIZE] = tile
+
+        if old == EMPTY_TILE:
+            self.counts[key] += 1
+        elif tile == EMPTY_TILE:
+            self.counts[key] -= 1
+            if self.counts[key] == 0:
+                del self.chunks[key]
+                del self.counts[key]
+        return True
+
+    def erase(self, x: int, y: int):
+        """
+        Empties cell (x, y)
+
+        :param x: x-coordinate
+        :param y: y-coordinate
+        ///////////////
+        :type x: int
+        :type y: int
+        ///////////////
+        :return: True if the layer changed
+        ///////////////
+        :rtype: bool
+        """
+        return self.set(x, y, EMPTY_TILE)
+
+    def set_cells(self, cells: Iterable[Tuple[int, int]], tile: int):
+        """
+        Paints tile on every cell of cells lying inside the layer, as a single edit
+
+        :param cells: (x, y) coordinates of the cells to paint
+        :param tile: tile ID (EMPTY_TILE to erase)
+        ///////////////
+        :type cells: Iterable[(int, int)]
+        :type tile: int
+        ///////////////
+        :return: coordinates of the cells that changed
+        ///////////////
+        :rtype: List[(int, int)]
+        """
+        return [(x, y) for x, y in cells if self.inside(x, y) and self.set(x, y, tile)]
+
+    def clear(self):
+        """
+        Empties every cell (frees every chunk)
+        """
+        self.chunks.clear()
+        self.counts.clear()
+
+    def copy(self):
+        layer = ChunkedTileLayer(self.w, self.h)
+        layer.chunks = {key: chunk.copy() for key, chunk in self.chunks.items()}
+        layer.counts = dict(self.counts)
+        return layer
+
+    def count(self):
+        """
+        Returns the amount of painted cells
+
+        :rtype: int
+        """
+        return sum(self.counts.values())
+
+    def is_empty(self):
+        return not self.chunks
+
+    def chunks_in(self, area=None):
+        """
+        Returns the coordinates of the allocated chunks overlapping area, row by row
+
+        :param area: (x, y, w, h) rectangle in tiles (default is the whole layer)
+        ///////////////
+        :type area: Rect
+        ///////////////
+        :rtype: List[(int, int)]
+        """
+        if area is None:
+            return sorted(self.chunks, key=lambda key: (key[1], key[0]))
+        x, y, w, h = area
+        cx0, cy0 = max(x, 0) // CHUNK_SIZE, max(y, 0) // CHUNK_SIZE
+        cx1, cy1 = (min(x + w, self.w) - 1) // CHUNK_SIZE, (min(y + h, self.h) - 1) // CHUNK_SIZE
+        if cx0 > cx1 or cy0 > cy1:
+            return []
+        # Look the area up chunk by chunk unless it covers more chunks than are allocated
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) <= len(self.chunks):
+            return [(cx, cy) for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1) if (cx, cy) in self.chunks]
+        return [key for key in self.chunks_in() if cx0 <= key[0] <= cx1 and cy0 <= key[1] <= cy1]
+
+    def items(self, area=None):
+        """
+        Iterates over the painted cells as (x, y, tile) triples, chunk by chunk
+        Only the allocated chunks overlapping area are visited
+
+        :param area: only the cells inside this (x, y, w, h) rectangle are returned (default is every cell)
+        ///////////////
+        :type area: Rect
+        ///////////////
+        :rtype: Iterator[(int, int, int)]
+        """
+        x0, y0, x1, y1 = 0, 0, self.w, self.h
+        if area is not None:
+            x, y, w, h = area
+            x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, self.w), min(y + h, self.h)
+        for cx, cy in self.chunks_in(area):
+            ox, oy = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+            sub = self.chunks[(cx, cy)][max(y0 - oy, 0):y1 - oy, max(x0 - ox, 0):x1 - ox]
+            ys, xs = np.nonzero(sub)
+            yield from zip((xs + max(x0, ox)).tolist(), (ys + max(y0, oy)).tolist(), sub[ys, xs].tolist())
+
+    def to_array(self):
+        """
+        Returns a new (h, w) array of tile IDs
+
+        :rtype: np.ndarray
+        """
+        tiles = np.zeros((self.h, self.w), dtype=np.uint8)
+        for (cx, cy), chunk in self.chunks.items():
+            ox, oy = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+            sub = tiles[oy:oy + CHUNK_SIZE, ox:ox + CHUNK_SIZE]
+            sub[:] = chunk[:sub.shape[0], :sub.shape[1]]
+        return tiles
+
+    def area_array(self, area):
+        """
+        Returns a new (h, w) array of the tile IDs inside the (x, y, w, h) rectangle area, cells outside the layer
+        being EMPTY_TILE
+        Only the allocated chunks overlapping area are visited
+
+        :param area: rectangle in tiles
+        ///////////////
+        :type area: Rect
+        ///////////////
+        :rtype: np.ndarray
+        """
+        x, y, w, h = area
+        tiles = np.zeros((h, w), dtype=np.uint8)
+        x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, self.w), min(y + h, self.h)
+        if x0 >= x1 or y0 >= y1:
+            return tiles
+        for cx, cy in self.chunks_in(area):
+            ox, oy = cx * CHUNK_SIZE, cy * CHUNK_SIZE
+            sx0, sy0 = max(x0, ox), max(y0, oy)
+            sx1, sy1 = min(x1, ox + CHUNK_SIZE), min(y1, oy + CHUNK_SIZE)
+            tiles[sy0 - y:sy1 - y, sx0 - x:sx1 - x] = self.chunks[(cx, cy)][sy0 - oy:sy1 - oy, sx0 - ox:sx1 - ox]
+        return tiles
+
+    @staticmethod
+    def from_array(tiles: np.ndarray):
+        """
+        Returns a layer holding the (h, w) array of tile IDs tiles, only the non-empty chunks being allocated
+
+        :param tiles: tile IDs
+        ///////////////
+        :type tiles: np.ndarray
+        ///////////////
+        :rtype: ChunkedTileLayer
+        """
+        h, w = tiles.shape
+        layer = ChunkedTileLayer(w, h)
+        for oy in range(0, h, CHUNK_SIZE):
+            for ox in range(0, w, CHUNK_SIZE):
+                sub = tiles[oy:oy + CHUNK_SIZE, ox:ox + CHUNK_SIZE]
+                count = int(np.count_nonzero(sub))
+                if count:
+                    chunk = np.zeros((CHUNK_SIZE, CHUNK_SIZE), dtype=np.uint8)
+                    chunk[:sub.shape[0], :sub.shape[1]] = sub
+                    layer.chunks[(ox // CHUNK_SIZE, oy // CHUNK_SIZE)] = chunk
+                    layer.counts[(ox // CHUNK_SIZE, oy // CHUNK_SIZE)] = count
+        return layer
+
+    def to_pixels(self):
+        """
+        Returns the painted cells in the ((x, y), tile) list format
+
+        :rtype: List[((int, int), int)]
+        """
+        return [((x, y), tile) for x, y, tile in self.items()]
+
+    @staticmethod
+    def from_pixels(w: int, h: int, pixels: Iterable):
+        """
+        Returns a w*h layer built from ((x, y), tile) pairs
+
+        :param w: width in tiles
+        :param h: height in tiles
+        :param pixels: ((x, y), tile) pairs
+        ///////////////
+        :type w: int
+        :type h: int
+        :type pixels: Iterable[((int, int), int)]
+        ///////////////
+        :rtype: ChunkedTileLayer
+        """
+        layer = ChunkedTileLayer(w, h)
+        for (x, y), tile in pixels:
+            layer.set(x, y, tile)
+        return layer
+
+
+def line_cells(x0: int, y0: int, x1: int, y1: int):
+    """
+    Returns the cells of the line going from cell (x0, y0) to cell (x1, y1), both included (Bresenham)
+    Consecutive cells are 8-connected, so a stroke drawn through them has no gap
+
+    :param x0: x-coordinate of the first cell
+    :param y0: y-coordinate of the first cell
+    :param x1: x-coordinate of the last cell
+    :param y1: y-coordinate of the last cell
+    ///////////////
+    :type x0: int
+    :type y0: int
+    :type x1: int
+    :type y1: int
+    ///////////////
+    :rtype: List[(int, int)]
+    """
+    dx, dy = abs(x1 - x0), -abs(y1 - y0)
+    sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+    error = dx + dy
+    cells = [(x0, y0)]
+    while (x0, y0) != (x1, y1):
+        e2 = 2 * error
+        if e2 >= dy:
+            error += dy
+            x0 += sx
+        if e2 <= dx:
+            error += dx
+            y0 += sy
+        cells.append((x0, y0))
+    return cells
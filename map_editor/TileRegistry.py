@@ -0,0 +1,234 @@
+from collections import OrderedDict
+from typing import *
+
+import numpy as np
+import pygame
+
+from TileLayer import EMPTY_TILE
+
+# Color of empty cells in exported images
+BACKGROUND_RGB = 0xFFFFFF
+
+# Most tile images kept scaled to another size than their own, the least recently used one being dropped first
+SCALED_CACHE_SIZE = 512
+
+
+def pack_rgb(r: int, g: int, b: int):
+    """
+    Packs a color into a single 0xRRGGBB integer
+    """
+    return (r << 16) | (g << 8) | b
+
+
+def unpack_rgb(rgb: int):
+    """
+    Unpacks a 0xRRGGBB integer into its (r, g, b) components
+    """
+    return (rgb >> 16) & 0xFF, (rgb >> 8) & 0xFF, rgb & 0xFF
+
+
+class TileType:
+    """
+    This class defines a kind of tile that can be painted on the map.
+    T.id is the tile ID stored in layers (never EMPTY_TILE).
+    T.name is the name of T, also the name of its image in the tile atlas.
+    T.rgb is the packed 0xRRGGBB color of T in exported images.
+    T.color is the same color as a pygame Color.
+    T.image is the (surface, area) pair to blit to draw T, None until an atlas is attached.
+    T.imageAlpha is the same as T.image but keeping per-pixel alpha.
+    """
+
+    def __init__(self, id: int, name: str, color: pygame.Color):
+        self.id = id
+        self.name = name
+        self.color = pygame.Color(color)
+        self.rgb = pack_rgb(self.color.r, self.color.g, self.color.b)
+        self.image = None
+        self.imageAlpha = None
+
+    def __str__(self):
+        return "{0} ({1}, #{2:06X})".format(self.name, self.id, self.rgb)
+
+
+class TileRegistry:
+    """
+    This class defines the set of tiles available in the editor with constant time lookups between
+    tile IDs, packed colors, names and images.
+    R.types is the list of tile types indexed by tile ID (R.types[EMPTY_TILE] is None).
+    R.byRGB maps each packed 0xRRGGBB color to its tile type.
+    R.byName maps each tile name to its tile type.
+    R.scaledImages maps (tile ID, size, alpha) to the image of the tile scaled to that size, least recently used first.
+    """
+
+    def __init__(self, types: List[TileType]):
+        self.types: List[Optional[TileType]] = [None] * (max((t.id for t in types), default=0) + 1)
+        for t in types:
+            self.types[t.id] = t
+        self.byRGB: Dict[int, TileType] = {t.rgb: t for t in types}
+        self.byName: Dict[str, TileType] = {t.name: t for t in types}
+        self.scaledImages: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self.byName)
+
+    def __getitem__(self, tile: int):
+        return self.types[tile]
+
+    def __iter__(self):
+        return (t for t in self.types if t is not None)
+
+    def name(self, tile: int):
+        return self.types[tile].name
+
+    def color(self, tile: int):
+        return self.types[tile].color
+
+    def rgb(self, tile: int):
+        return self.types[tile].rgb
+
+    def from_name(self, name: str):
+        """
+        Returns the tile ID named name, EMPTY_TILE if there is none
+        """
+        t = self.byName.get(name.lower())
+        return EMPTY_TILE if t is None else t.id
+
+    def attach_atlas(self, atlas):
+        """
+        Resolves the image of every tile type once from atlas
+
+        :param atlas: atlas holding an image named after each tile type
+        ///////////////
+        :type atlas: TileAtlas
+        """
+        for t in self:
+            if t.name in atlas:
+                t.image = atlas.area(t.name)
+                t.imageAlpha = atlas.area(t.name, True)
+        self.scaledImages.clear()
+
+    def scaled(self, tile: int, size: int = None, alpha: bool = False):
+        """
+        Returns the (surface, area) pair needed to blit the image of tile scaled to size*size pixels
+        Each image is only scaled once (smoothly) for a given size, at most SCALED_CACHE_SIZE of them being kept
+
+        :param tile: tile ID
+        :param size: size in pixels of the image (default is the size of the image in the atlas)
+        :param alpha: per-pixel alpha is kept if True
+        ///////////////
+        :type tile: int
+        :type size: int
+        :type alpha: bool
+        ///////////////
+        :rtype: (Surface, Rect)
+        """
+        t = self.types[tile]
+        image, area = t.imageAlpha if alpha else t.image
+        if size is None or area.size == (size, size):
+            return image, area
+
+        key = (tile, size, alpha)
+        S = self.scaledImages.get(key)
+        if S is None:
+            S = pygame.transform.smoothscale(image.subsurface(area), (size, size))
+            self.scaledImages[key] = S
+            if len(self.scaledImages) > SCALED_CACHE_SIZE:
+                self.scaledImages.popitem(last=False)
+        else:
+            self.scaledImages.move_to_end(key)
+        return S, S.get_rect()
+
+    def blit(self, tile: int, x: int, y: int, S: pygame.Surface, alpha: bool = False, size: int = None):
+        """
+        Draws the image of tile with its top-left corner at (x, y) on surface S
+
+        :param tile: tile ID
+        :param x: x-coordinate on S
+        :param y: y-coordinate on S
+        :param S: surface to draw on
+        :param alpha: per-pixel alpha is kept if True
+        :param size: size in pixels of the image drawn (default is the size of the image in the atlas, see scaled)
+        ///////////////
+        :type tile: int
+        :type x: int
+        :type y: int
+        :type S: Surface
+        :type alpha: bool
+        :type size: int
+        """
+        image, area = self.scaled(tile, size, alpha)
+        S.blit(image, (int(x), int(y)), area)
+
+    def palette(self):
+        """
+        Returns the (256, 3) array of the RGB color of every tile ID, empty and unknown IDs being BACKGROUND_RGB
+
+        :rtype: np.ndarray
+        """
+        colors = np.empty((256, 3), dtype=np.uint8)
+        colors[:] = unpack_rgb(BACKGROUND_RGB)
+        for t in self:
+            colors[t.id] = unpack_rgb(t.rgb)
+        return colors
+
+    def to_surface(self, tiles: np.ndarray):
+        """
+        Returns an image of tiles with one pixel per cell, colored with the color of its tile ID
+        The whole image is built with a single palette lookup, without drawing anything
+
+        :param tiles: (h, w) array of tile IDs
+        ///////////////
+        :type tiles: np.ndarray
+        ///////////////
+        :rtype: Surface
+        """
+        return pygame.surfarray.make_surface(self.palette()[tiles].swapaxes(0, 1))
+
+    def from_surface(self, S: pygame.Surface):
+        """
+        Returns the tile IDs of an image with one pixel per cell (i.e. the reverse of to_surface)
+        Every pixel is looked up at once, BACKGROUND_RGB and unknown colors becoming EMPTY_TILE
+
+        :param S: image to read
+        ///////////////
+        :type S: Surface
+        ///////////////
+        :return: (h, w) array of tile IDs
+        ///////////////
+        :rtype: np.ndarray
+        """
+        pixels = pygame.surfarray.pixels3d(S) if S.get_bitsize() >= 24 else pygame.surfarray.array3d(S)
+        rgb = (pixels[..., 0].astype(np.int32) << 16) | (pixels[..., 1].astype(np.int32) << 8) | pixels[..., 2]
+        del pixels
+        rgb = rgb.T
+
+        # Sorted packed colors and their tile IDs, searched for every pixel at once
+        colors = np.array(sorted(c for c in self.byRGB if c != BACKGROUND_RGB), dtype=np.int32)
+        if len(colors) == 0:
+            return np.zeros(rgb.shape, dtype=np.uint8)
+        ids = np.array([self.byRGB[c].id for c in colors], dtype=np.uint8)
+        index = np.minimum(np.searchsorted(colors, rgb), len(colors) - 1)
+        return np.where(colors[index] == rgb, ids[index], EMPTY_TILE).astype(np.uint8)
+
+
+def load_registry(path: str = "buttons.blf"):
+    """
+    Builds the tile registry from a .blf (Button-Listing File) file
+    Tile IDs follow the order of the file, starting at 1 (i.e. block button i paints tile ID i + 1)
+
+    :param path: path to the .blf file
+    ///////////////
+    :type path: str
+    ///////////////
+    :rtype: TileRegistry
+    """
+    types: List[TileType] = []
+    with open(path, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line[0] == '#':
+                continue
+            arguments: List[str] = line.split(';')
+            types.append(TileType(len(types) + 1, arguments[2].lower(),
+                                  pygame.Color(arguments[5]) if len(arguments) > 5 else pygame.Color(255, 255, 255)))
+    return TileRegistry(types)
@@ -24,6 +24,8 @@ PART 11 : RANDOM VALUES
 from math import *
 import cmath
 import random
+from collections import OrderedDict
+from contextlib import contextmanager
 import pygame
 from pygame.locals import *
 
@@ -41,11 +43,15 @@ PYGAME_SDL_WEIGHT = 0  # width of the graphic window
 PYGAME_SDL_HEIGHT = 0  # height of the graphic window
 PYGAME_SDL_FONT = "verdana"  # default font
 PYGAME_SDL_DISPLAY = 1  # default display constant
+PYGAME_SDL_FRAME = None  # parts of the window drawn on since the start of the current frame (None outside frames)
 
 PYGAME_SDL_WINDOW = pygame.display.set_mode((10, 10))
 
 SWATCH = 0
 
+PYGAME_SDL_IMAGE_CACHE_SIZE = 256  # maximum amount of surfaces kept by the image cache
+PYGAME_SDL_TEXT_CACHE_SIZE = 128  # maximum amount of rendered texts kept by the text cache
+
 NAUGHT = -42
 
 # endregion
@@ -90,10 +96,11 @@ class Button:
     B.color_bg is the background color of Button B.
     B.contour is a boolean defining if B has a contour that must be drawn
     B.imagePath is the string containing the path to the image to be displayed on B
+    B.image is an optional (surface, area) pair displayed on B instead of loading B.imagePath
     """
 
     def __init__(self, P, text, w, h=None, color_fg=pygame.Color(255), color_bg=pygame.Color(0), contour=False,
-                 imagePath=None):
+                 imagePath=None, image=None):
         self.P = P
         self.text = text
         self.w = w
@@ -106,6 +113,7 @@ class Button:
         self.color_bg = color_bg
         self.contour = contour
         self.imagePath = imagePath
+        self.image = image
 
     def __str__(self):
         return "Button at {0}:\n" \
@@ -120,6 +128,9 @@ class Button:
     def inside(self, point):
         return self.P.x < point.x < self.P.x + self.w and self.P.y < point.y < self.P.y + self.h
 
+    def rect(self):
+        return pygame.Rect(int(self.P.x), int(self.P.y), int(self.w), int(self.h))
+
     def draw(self, flip_grounds: bool = False, text: bool = False):
         fg = self.color_fg
         bg = self.color_bg
@@ -132,6 +143,8 @@ class Button:
                 display_text_center(self.text, 12, Point(self.P.x + self.w / 2, self.P.y + self.h / 2), fg)
             if self.contour:
                 draw_rectangle(self.P, self.w, self.h, fg)
+        elif self.image is not None:
+            display_image(self.image[0], self.P, self.image[1])
         else:
             load_image(self.imagePath, self.P)
 
@@ -229,6 +242,8 @@ def init_graphic(W: int, H: int, name: str = "SynPython", bg_color: Color = blac
     else:
         PYGAME_SDL_WINDOW = pygame.display.set_mode((int(W), int(H)), FULLSCREEN)
     pygame.display.set_caption(name)
+    # Cached surfaces were converted to the previous display format
+    PYGAME_SDL_IMAGE_CACHE.clear()
     pygame.draw.rect(PYGAME_SDL_WINDOW, bg_color, (0, 0, int(W), int(H)), 0)
     pygame.display.flip()
 
@@ -289,6 +304,196 @@ def display_all():
     pygame.display.flip()
 
 
+def damage(rect: pygame.Rect = None, S: pygame.Surface = None):
+    """
+    Notifies that rect of surface S (default is the graphic window) was just drawn on
+    Inside a frame, rect is kept to be displayed once at the end of the frame
+    Outside of frames, the whole window is displayed right away if automatic display is on
+
+    :param rect: part of S that was drawn on
+    :param S: surface that was drawn on
+    ///////////////
+    :type rect: Rect
+    :type S: Surface
+    """
+    if PYGAME_SDL_FRAME is not None:
+        if rect is not None and (S is None or S is PYGAME_SDL_WINDOW):
+            PYGAME_SDL_FRAME.add(rect)
+    elif PYGAME_SDL_DISPLAY == 1:
+        pygame.display.flip()
+
+
+def begin_frame():
+    """
+    Starts a frame: until end_frame is called, drawings are not displayed, only the parts of the window they
+    changed are kept
+    """
+    global PYGAME_SDL_FRAME
+    PYGAME_SDL_FRAME = DirtyRegions()
+
+
+def end_frame():
+    """
+    Ends the current frame by displaying every part of the window that was drawn on during it, all at once
+
+    :return: displayed parts of the window
+    ///////////////
+    :rtype: List[Rect]
+    """
+    global PYGAME_SDL_FRAME
+    rects = PYGAME_SDL_FRAME.rects if PYGAME_SDL_FRAME is not None else []
+    PYGAME_SDL_FRAME = None
+    display_update(rects)
+    return rects
+
+
+@contextmanager
+def frame():
+    """
+    Draws everything inside of a with block as a single frame (see begin_frame and end_frame)
+    e.g.  with frame():
+              draw_line(P, Q, red)
+              draw_circle(P, 10, red)
+    """
+    begin_frame()
+    try:
+        yield PYGAME_SDL_FRAME
+    finally:
+        end_frame()
+
+
+def display_update(rects):
+    """
+    Allows display of shape drawings located inside of rects only
+
+    :param rects: parts of the graphic window to display
+    ///////////////
+    :type rects: List[Rect]
+    """
+    if rects:
+        pygame.display.update(rects)
+
+
+def clip_display(rect: pygame.Rect = None):
+    """
+    Restricts every following drawing to rect (or removes the restriction if rect is None)
+
+    :param rect: part of the graphic window that can be drawn on
+    ///////////////
+    :type rect: Rect
+    """
+    PYGAME_SDL_WINDOW.set_clip(rect)
+
+
+class DirtyRegions:
+    """
+    This class defines a set of rectangles of the graphic window that need to be drawn again.
+    D.rects is the list of rectangles, none of which is contained in another one.
+    D.limit is the amount of rectangles above which they are all merged into their union.
+    """
+
+    def __init__(self, limit: int = 32):
+        self.rects = []
+        self.limit = limit
+
+    def __bool__(self):
+        return len(self.rects) > 0
+
+    def add(self, *rects):
+        """
+        Marks rects as needing to be drawn again
+
+        :param rects: rectangles to add
+        ///////////////
+        :type rects: Rect
+        """
+        for rect in rects:
+            rect = pygame.Rect(rect)
+            if rect.w <= 0 or rect.h <= 0 or any(r.contains(rect) for r in self.rects):
+                continue
+            self.rects = [r for r in self.rects if not rect.contains(r)]
+            self.rects.append(rect)
+        if len(self.rects) > self.limit:
+            self.rects = [self.rects[0].unionall(self.rects[1:])]
+
+    def collides(self, rect: pygame.Rect):
+        """
+        Returns True if rect overlaps any of the rectangles
+
+        :param rect: rectangle to test
+        ///////////////
+        :type rect: Rect
+        ///////////////
+        :rtype: bool
+        """
+        return pygame.Rect(rect).collidelist(self.rects) != -1
+
+    def clear(self):
+        """
+        Forgets every rectangle
+        """
+        self.rects = []
+
+
+class SaveUnder:
+    """
+    This class defines a small overlay (e.g. a cursor) drawn over the graphic window.
+    The pixels hidden by the overlay are saved when it is shown, so hiding it again doesn't require redrawing them.
+    O.w is the width of overlay O.
+    O.h is the height of overlay O.
+    O.under is the surface holding the pixels hidden by O.
+    O.P is the top-left point of O while it is shown, None otherwise.
+    """
+
+    def __init__(self, w: int, h: int):
+        self.w = w
+        self.h = h
+        self.under = pygame.Surface((w, h)).convert()
+        self.P = None
+
+    def rect(self):
+        """
+        Returns the part of the graphic window covered by the overlay, None if it is hidden
+
+        :rtype: Rect
+        """
+        if self.P is None:
+            return None
+        return pygame.Rect(int(self.P.x), int(self.P.y), self.w, self.h)
+
+    def show(self, P: Point):
+        """
+        Saves the pixels that are about to be hidden by the overlay at top-left point P
+        The overlay itself is then to be drawn by the caller
+
+        :param P: top-left point
+        ///////////////
+        :type P: Point
+        ///////////////
+        :return: part of the graphic window covered by the overlay
+        ///////////////
+        :rtype: Rect
+        """
+        self.P = P
+        rect = self.rect()
+        self.under.blit(PYGAME_SDL_WINDOW, (0, 0), rect)
+        return rect
+
+    def hide(self):
+        """
+        Puts back the pixels hidden by the overlay
+
+        :return: part of the graphic window that was restored, None if the overlay wasn't shown
+        ///////////////
+        :rtype: Rect
+        """
+        rect = self.rect()
+        if rect is not None:
+            damage(PYGAME_SDL_WINDOW.blit(self.under, rect))
+            self.P = None
+        return rect
+
+
 # endregion
 
 # region Text Display
@@ -296,6 +501,72 @@ def display_all():
 # PART 4 : TEXT DISPLAY
 # --------------------------------------------------
 
+# region Font Cache
+# PART 4.1 : FONT CACHE
+
+PYGAME_SDL_FONTS = {}
+PYGAME_SDL_TEXTS = OrderedDict()
+
+
+def get_font(t: int, text_bold: bool = False, text_italic: bool = False):
+    """
+    Returns the font of size t in the current font face (i.e. PYGAME_SDL_FONT)
+    Fonts are only looked up on the system the first time they are used
+
+    :param t: font size
+    :param text_bold: text bold if true, normal otherwise
+    :param text_italic: text italic if true, normal otherwise
+    ///////////////
+    :type t: int
+    :type text_bold: bool
+    :type text_italic: bool
+    ///////////////
+    :rtype: Font
+    """
+    key = (PYGAME_SDL_FONT, t, bool(text_bold), bool(text_italic))
+    font = PYGAME_SDL_FONTS.get(key)
+    if font is None:
+        font = PYGAME_SDL_FONTS[key] = pygame.font.SysFont(PYGAME_SDL_FONT, t, bold=text_bold, italic=text_italic)
+    return font
+
+
+def render_text(T: str, t: int, C: Color, text_bold: bool = False, text_italic: bool = False):
+    """
+    Returns the surface of text T written in font size t with color C
+    The last PYGAME_SDL_TEXT_CACHE_SIZE rendered texts are kept so that they aren't rendered again
+    /!\\ Beware, the surface is shared with every other caller, copy it before modifying it
+
+    :param T: text
+    :param t: font size
+    :param C: text color
+    :param text_bold: text bold if true, normal otherwise
+    :param text_italic: text italic if true, normal otherwise
+    ///////////////
+    :type T: str
+    :type t: int
+    :type C: Color
+    :type text_bold: bool
+    :type text_italic: bool
+    ///////////////
+    :rtype: Surface
+    """
+    key = (T, PYGAME_SDL_FONT, t, bool(text_bold), bool(text_italic), tuple(pygame.Color(C)))
+    text = PYGAME_SDL_TEXTS.get(key)
+    if text is not None:
+        PYGAME_SDL_TEXTS.move_to_end(key)
+        return text
+
+    text = PYGAME_SDL_TEXTS[key] = get_font(t, text_bold, text_italic).render(T, 1, C)
+    while len(PYGAME_SDL_TEXTS) > PYGAME_SDL_TEXT_CACHE_SIZE:
+        PYGAME_SDL_TEXTS.popitem(last=False)
+    return text
+
+
+# endregion
+
+# region Text Functions
+# PART 4.2 : TEXT FUNCTIONS
+
 def text_width(T: str, t: int, text_bold: bool = False, text_italic: bool = False):
     """
     Computes the width of a text T written in font size t
@@ -314,10 +585,7 @@ def text_width(T: str, t: int, text_bold: bool = False, text_italic: bool = Fals
     ///////////////
     :rtype: int
     """
-    font = pygame.font.SysFont(PYGAME_SDL_FONT, t, bold=text_bold, italic=text_italic)
-    text = font.render(T, 1, black)
-    text_coordinates = text.get_rect()
-    return tuple(text_coordinates)[2]
+    return get_font(t, text_bold, text_italic).size(T)[0]
 
 
 def text_height(T, t, text_bold=False, text_italic=False):
@@ -338,10 +606,7 @@ def text_height(T, t, text_bold=False, text_italic=False):
     ///////////////
     :rtype: int
     """
-    font = pygame.font.SysFont(PYGAME_SDL_FONT, t, bold=text_bold, italic=text_italic)
-    text = font.render(T, 1, black)
-    text_coordinates = text.get_rect()
-    return tuple(text_coordinates)[3]
+    return get_font(t, text_bold, text_italic).size(T)[1]
 
 
 def display_text(T: str, t: int, P: Point, C: Color, text_bold: bool = False, text_italic: bool = False):
@@ -364,11 +629,8 @@ def display_text(T: str, t: int, P: Point, C: Color, text_bold: bool = False, te
     """
     P.x = int(P.x)
     P.y = int(P.y)
-    font = pygame.font.SysFont(PYGAME_SDL_FONT, t, bold=text_bold, italic=text_italic)
-    text = font.render(T, 1, C)
-    PYGAME_SDL_WINDOW.blit(text, (P.x, P.y))
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    text = render_text(T, t, C, text_bold, text_italic)
+    damage(PYGAME_SDL_WINDOW.blit(text, (P.x, P.y)))
 
 
 def display_text_center(T: str, t: int, P: Point, C: Color, text_bold: bool = False, text_italic: bool = False):
@@ -391,11 +653,8 @@ def display_text_center(T: str, t: int, P: Point, C: Color, text_bold: bool = Fa
     """
     P.x = int(P.x)
     P.y = int(P.y)
-    font = pygame.font.SysFont(PYGAME_SDL_FONT, t, bold=text_bold, italic=text_italic)
-    text = font.render(T, 1, C)
-    PYGAME_SDL_WINDOW.blit(text, (P.x - text_width(T, t) / 2, P.y - text_height(T, t) / 2))
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    text = render_text(T, t, C, text_bold, text_italic)
+    damage(PYGAME_SDL_WINDOW.blit(text, (P.x - text.get_width() / 2, P.y - text.get_height() / 2)))
 
 
 def list_fonts():
@@ -436,6 +695,7 @@ def change_font(S: str):
         PYGAME_SDL_FONT = S
 
 
+# endregion
 # endregion
 
 # region Shape Drawing
@@ -455,9 +715,7 @@ def draw_pixel(P: Point, C: Color):
     """
     P.x = int(P.x)
     P.y = int(P.y)
-    pygame.draw.line(PYGAME_SDL_WINDOW, C, (P.x, P.y), (P.x, P.y), 1)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage(pygame.draw.line(PYGAME_SDL_WINDOW, C, (P.x, P.y), (P.x, P.y), 1))
 
 
 def draw_line(P: Point, Q: Point, C: Color):
@@ -476,9 +734,7 @@ def draw_line(P: Point, Q: Point, C: Color):
     P.y = int(P.y)
     Q.x = int(Q.x)
     Q.y = int(Q.y)
-    pygame.draw.line(PYGAME_SDL_WINDOW, C, (P.x, P.y), (Q.x, Q.y), 1)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage(pygame.draw.line(PYGAME_SDL_WINDOW, C, (P.x, P.y), (Q.x, Q.y), 1))
 
 
 def draw_triangle(P: Point, Q: Point, R: Point, C: Color):
@@ -501,9 +757,7 @@ def draw_triangle(P: Point, Q: Point, R: Point, C: Color):
     Q.y = int(Q.y)
     R.x = int(R.x)
     R.y = int(R.y)
-    pygame.draw.polygon(PYGAME_SDL_WINDOW, C, ([P.x, P.y], [Q.x, Q.y], [R.x, R.y]), 1)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage(pygame.draw.polygon(PYGAME_SDL_WINDOW, C, ([P.x, P.y], [Q.x, Q.y], [R.x, R.y]), 1))
 
 
 def draw_fill_triangle(P: Point, Q: Point, R: Point, C: Color):
@@ -526,9 +780,7 @@ def draw_fill_triangle(P: Point, Q: Point, R: Point, C: Color):
     Q.y = int(Q.y)
     R.x = int(R.x)
     R.y = int(R.y)
-    pygame.draw.polygon(PYGAME_SDL_WINDOW, C, ([P.x, P.y], [Q.x, Q.y], [R.x, R.y]), 0)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage(pygame.draw.polygon(PYGAME_SDL_WINDOW, C, ([P.x, P.y], [Q.x, Q.y], [R.x, R.y]), 0))
 
 
 def draw_rectangle(P: Point, w: float, h: float, C: pygame.Color, S: pygame.Surface = PYGAME_SDL_WINDOW):
@@ -547,9 +799,7 @@ def draw_rectangle(P: Point, w: float, h: float, C: pygame.Color, S: pygame.Surf
     :type C: pygame.Color
     :type S: pygame.Surface
     """
-    pygame.draw.rect(S, C, (int(P.x), int(P.y), int(w), int(h)), 1)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage(pygame.draw.rect(S, C, (int(P.x), int(P.y), int(w), int(h)), 1), S)
 
 
 def draw_fill_rectangle(P: Point, w: float, h: float, C: pygame.Color, S: pygame.Surface = PYGAME_SDL_WINDOW):
@@ -568,9 +818,7 @@ def draw_fill_rectangle(P: Point, w: float, h: float, C: pygame.Color, S: pygame
     :type C: pygame.Color
     :type S: pygame.Surface
     """
-    pygame.draw.rect(S, C, (int(P.x), int(P.y), int(w), int(h)), 0)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage(pygame.draw.rect(S, C, (int(P.x), int(P.y), int(w), int(h)), 0), S)
 
 
 def draw_rectangle_center(P: Point, w: float, h: float, C: Color):
@@ -587,9 +835,7 @@ def draw_rectangle_center(P: Point, w: float, h: float, C: Color):
     :type h: float
     :type C: Color
     """
-    pygame.draw.rect(PYGAME_SDL_WINDOW, C, (int(P.x - w / 2), int(P.y - h / 2), int(w), int(h)), 1)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage(pygame.draw.rect(PYGAME_SDL_WINDOW, C, (int(P.x - w / 2), int(P.y - h / 2), int(w), int(h)), 1))
 
 
 def draw_fill_rectangle_center(P: Point, w: float, h: float, C: Color):
@@ -606,9 +852,7 @@ def draw_fill_rectangle_center(P: Point, w: float, h: float, C: Color):
     :type h: float
     :type C: Color
     """
-    pygame.draw.rect(PYGAME_SDL_WINDOW, C, (int(P.x - w / 2), int(P.y - h / 2), int(w), int(h)), 0)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage(pygame.draw.rect(PYGAME_SDL_WINDOW, C, (int(P.x - w / 2), int(P.y - h / 2), int(w), int(h)), 0))
 
 
 def draw_circle(P: Point, r: float, C: Color = white):
@@ -626,9 +870,7 @@ def draw_circle(P: Point, r: float, C: Color = white):
     P.x = int(P.x)
     P.y = int(P.y)
     r = int(r)
-    pygame.draw.circle(PYGAME_SDL_WINDOW, C, (P.x, P.y), r, 1)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage(pygame.draw.circle(PYGAME_SDL_WINDOW, C, (P.x, P.y), r, 1))
 
 
 def draw_fill_circle(P: Point, r: float, C: Color):
@@ -646,9 +888,7 @@ def draw_fill_circle(P: Point, r: float, C: Color):
     P.x = int(P.x)
     P.y = int(P.y)
     r = int(r)
-    pygame.draw.circle(PYGAME_SDL_WINDOW, C, (P.x, P.y), r, 0)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage(pygame.draw.circle(PYGAME_SDL_WINDOW, C, (P.x, P.y), r, 0))
 
 
 def draw_ellipse(P: Point, w: float, h: float, C: Color):
@@ -665,9 +905,7 @@ def draw_ellipse(P: Point, w: float, h: float, C: Color):
     :type h: float
     :type C: Color
     """
-    pygame.draw.ellipse(PYGAME_SDL_WINDOW, C, (int(P.x - w / 2), int(P.y - h / 2), int(w), int(h)), 1)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage(pygame.draw.ellipse(PYGAME_SDL_WINDOW, C, (int(P.x - w / 2), int(P.y - h / 2), int(w), int(h)), 1))
 
 
 def draw_fill_ellipse(P: Point, w: float, h: float, C: Color):
@@ -684,9 +922,7 @@ def draw_fill_ellipse(P: Point, w: float, h: float, C: Color):
     :type h: float
     :type C: Color
     """
-    pygame.draw.ellipse(PYGAME_SDL_WINDOW, C, (int(P.x - w / 2), int(P.y - h / 2), int(w), int(h)), 0)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage(pygame.draw.ellipse(PYGAME_SDL_WINDOW, C, (int(P.x - w / 2), int(P.y - h / 2), int(w), int(h)), 0))
 
 
 def draw_arc(P: Point, w: float, h: float, start: float, end: float, C):
@@ -708,9 +944,7 @@ def draw_arc(P: Point, w: float, h: float, start: float, end: float, C):
     :type end: float
     :type C: Color
     """
-    pygame.draw.arc(PYGAME_SDL_WINDOW, C, (int(P.x - w / 2), int(P.y - h / 2), int(w), int(h)), start, end, 1)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage(pygame.draw.arc(PYGAME_SDL_WINDOW, C, (int(P.x - w / 2), int(P.y - h / 2), int(w), int(h)), start, end, 1))
 
 
 def draw_sector(P: Point, r: float, start: float, end: float, C: Color):
@@ -733,8 +967,7 @@ def draw_sector(P: Point, r: float, start: float, end: float, C: Color):
     draw_arc(P, 2 * r, 2 * r, start, end, C)
     draw_line(P, Point(P.x + r * cos(start), P.y - r * sin(start)), C)
     draw_line(P, Point(P.x + r * cos(end), P.y - r * sin(end)), C)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage()
 
 
 def draw_fill_sector(P: Point, r: float, start: float, end: float, C: Color, live: bool = False):
@@ -770,8 +1003,7 @@ def draw_fill_sector(P: Point, r: float, start: float, end: float, C: Color, liv
                 draw_pixel(Point(P.x + x, P.y - y), C)
     if not live:
         auto_display_toggle(True)
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    damage()
 
 
 # endregion
@@ -781,10 +1013,113 @@ def draw_fill_sector(P: Point, r: float, start: float, end: float, C: Color, liv
 # PART 6 : IMAGE MANAGEMENT
 # --------------------------------------------------
 
+# region Image Cache
+# PART 6.1 : IMAGE CACHE
+
+class SurfaceCache:
+    """
+    This class defines a bounded cache of images already converted to the display format.
+    Images are keyed by their path and alpha mode, the least recently used one is dropped when full.
+    C.capacity is the maximum amount of surfaces kept by cache C.
+    C.hits is the amount of lookups that were served without touching the disk.
+    C.misses is the amount of lookups that had to load the image from disk.
+    """
+
+    def __init__(self, capacity: int = PYGAME_SDL_IMAGE_CACHE_SIZE):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.surfaces = OrderedDict()
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def get(self, title: str, alpha: bool = False):
+        """
+        Returns the converted surface of image title, loading it from disk if it isn't cached yet
+        /!\\ Beware, the surface is shared with every other caller, copy it before modifying it
+
+        :param title: image path
+        :param alpha: per-pixel alpha is kept if True
+        ///////////////
+        :type title: str
+        :type alpha: bool
+        ///////////////
+        :return: converted surface
+        ///////////////
+        :rtype: Surface
+        """
+        key = (title, bool(alpha))
+        image = self.surfaces.get(key)
+        if image is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return image
+
+        self.misses += 1
+        image = pygame.image.load(title)
+        image = image.convert_alpha() if alpha else image.convert()
+        self.surfaces[key] = image
+        while len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return image
+
+    def invalidate(self, title: str):
+        """
+        Drops every cached version of image title so that it gets reloaded on next use
+
+        :param title: image path
+        ///////////////
+        :type title: str
+        """
+        self.surfaces.pop((title, False), None)
+        self.surfaces.pop((title, True), None)
+
+    def clear(self):
+        """
+        Drops every cached surface
+        """
+        self.surfaces.clear()
+
+
+PYGAME_SDL_IMAGE_CACHE = SurfaceCache()
+
+
+def invalidate_image(title: str = None):
+    """
+    Forces image title (or every image if title is None) to be reloaded from disk on next use
+
+    :param title: image path
+    ///////////////
+    :type title: str
+    """
+    if title is None:
+        PYGAME_SDL_IMAGE_CACHE.clear()
+    else:
+        PYGAME_SDL_IMAGE_CACHE.invalidate(title)
+
+
+def image_cache_stats():
+    """
+    Returns the hit and miss counters and the current size of the image cache
+
+    :return: (hits, misses, size)
+    ///////////////
+    :rtype: (int, int, int)
+    """
+    return PYGAME_SDL_IMAGE_CACHE.hits, PYGAME_SDL_IMAGE_CACHE.misses, len(PYGAME_SDL_IMAGE_CACHE)
+
+
+# endregion
+
+# region Image Display
+# PART 6.2 : IMAGE DISPLAY
+
 def load_image(title: str, P: Point):
     """
     Displays an image with image path title and top-left point P
     Returns the image as a pygame surface
+    The image is only read from disk the first time, see SurfaceCache
 
     :param title: image path
     :param P: top-left point
@@ -798,10 +1133,8 @@ def load_image(title: str, P: Point):
     """
     P.x = int(P.x)
     P.y = int(P.y)
-    image = pygame.image.load(title).convert()
-    PYGAME_SDL_WINDOW.blit(image, (P.x, P.y))
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    image = PYGAME_SDL_IMAGE_CACHE.get(title)
+    damage(PYGAME_SDL_WINDOW.blit(image, (P.x, P.y)))
     return image
 
 
@@ -809,6 +1142,7 @@ def load_image_alpha(title: str, P: Point):
     """
     Displays a transparent image with image path title and top-left point P
     Returns the image as a pygame surface
+    The image is only read from disk the first time, see SurfaceCache
 
     :param title: image path
     :param P: top-left point
@@ -822,13 +1156,43 @@ def load_image_alpha(title: str, P: Point):
     """
     P.x = int(P.x)
     P.y = int(P.y)
-    image = pygame.image.load(title).convert_alpha()
-    PYGAME_SDL_WINDOW.blit(image, (P.x, P.y))
-    if PYGAME_SDL_DISPLAY == 1:
-        pygame.display.flip()
+    image = PYGAME_SDL_IMAGE_CACHE.get(title, True)
+    damage(PYGAME_SDL_WINDOW.blit(image, (P.x, P.y)))
     return image
 
 
+def display_image(I: pygame.Surface, P: Point, area: pygame.Rect = None):
+    """
+    Displays image I (or only the part of I inside area) with top-left point P
+
+    :param I: image
+    :param P: top-left point
+    :param area: part of I to display (default is all of I)
+    ///////////////
+    :type I: Surface
+    :type P: Point
+    :type area: Rect
+    """
+    damage(PYGAME_SDL_WINDOW.blit(I, (int(P.x), int(P.y)), area))
+
+
+def capture_display(rect: pygame.Rect = None):
+    """
+    Returns a copy of the part of the graphic window inside rect (default is the whole window)
+
+    :param rect: part of the graphic window to copy
+    ///////////////
+    :type rect: Rect
+    ///////////////
+    :return: surface with the copied pixels on it
+    ///////////////
+    :rtype: Surface
+    """
+    if rect is None:
+        return PYGAME_SDL_WINDOW.copy()
+    return PYGAME_SDL_WINDOW.subsurface(rect).copy()
+
+
 def transfer_image(title: str):
     """
     Returns the image as a pygame surface
@@ -892,6 +1256,7 @@ def resize_image(I: pygame.Surface, W: int, H: int):
     return pygame.transform.scale(I, (W, H))
 
 
+# endregion
 # endregion
 
 # region Sounds and Music Management
@@ -1043,19 +1408,61 @@ def get_busy_music():
 # endregion
 
 # region General Input Handling
-def get_input_down():
-    for event in pygame.event.get():
+def get_events(timeout: int = 0):
+    """
+    Returns every pending event
+    If there is none, waits for one for at most timeout milliseconds (0 doesn't wait, -1 waits forever)
+    The process sleeps while waiting
+
+    :param timeout: maximum number of milliseconds to wait for
+    ///////////////
+    :type timeout: int
+    ///////////////
+    :return: pending events, empty if the time ran out
+    ///////////////
+    :rtype: List[Event]
+    """
+    events = pygame.event.get()
+    if not events and timeout != 0:
+        event = pygame.event.wait() if timeout < 0 else pygame.event.wait(timeout)
+        if event.type != NOEVENT:
+            events = [event] + pygame.event.get()
+    return events
+
+
+def input_down(event):
+    """
+    Returns the key or mouse button pressed by event, as (key, None) or (None, [button, position])
+
+    :param event: event to look at
+    ///////////////
+    :type event: Event
+    ///////////////
+    :return: pressed key or mouse button, None if event isn't a press
+    """
+    if event.type == MOUSEBUTTONDOWN:
+        if event.button in (BUTTON_LEFT, BUTTON_MIDDLE, BUTTON_RIGHT):
+            return None, [event.button, Point(event.pos[0], event.pos[1])]
+    elif event.type == KEYDOWN:
+        return event.key, None
+    return None
+
+
+def get_input_down(events: list = None):
+    """
+    Returns the first key or mouse button pressed, as (key, None) or (None, [button, position])
+    Reads the pending events unless a list of events is given
+
+    :param events: events to look through
+    ///////////////
+    :type events: List[Event]
+    """
+    for event in (pygame.event.get() if events is None else events):
         if event.type == pygame.QUIT:
             return pygame.quit()
-        elif event.type == MOUSEBUTTONDOWN:
-            if event.button == 1:
-                return None, [BUTTON_LEFT, Point(event.pos[0], event.pos[1])]
-            elif event.button == 2:
-                return None, [BUTTON_MIDDLE, Point(event.pos[0], event.pos[1])]
-            elif event.button == 3:
-                return None, [BUTTON_RIGHT, Point(event.pos[0], event.pos[1])]
-        elif event.type == KEYDOWN:
-            return event.key, None
+        down = input_down(event)
+        if down is not None:
+            return down
     return None
 # endregion
 
@@ -1335,6 +1742,33 @@ def swatch_val():
     return pygame.time.get_ticks() - SWATCH
 
 
+def set_timeout(event_type: int, ms: int):
+    """
+    Posts a single event of type event_type once ms milliseconds have passed
+    Starting it again before then restarts the countdown
+
+    :param event_type: event type to post (from USEREVENT on)
+    :param ms: number of milliseconds to wait for
+    ///////////////
+    :type event_type: int
+    :type ms: int
+    """
+    pygame.time.set_timer(event_type, ms, 1)
+
+
+def set_interval(event_type: int, ms: int):
+    """
+    Posts an event of type event_type every ms milliseconds (stops if ms is 0)
+
+    :param event_type: event type to post (from USEREVENT on)
+    :param ms: number of milliseconds between two events
+    ///////////////
+    :type event_type: int
+    :type ms: int
+    """
+    pygame.time.set_timer(event_type, ms)
+
+
 # endregion
 
 # region Random Values